@@ -0,0 +1,7 @@
+-- Analysis progress channel
+-- Partial progress written by run_analysis.py / generate_recommendations.py when run with --stream
+-- (stage, sections and concerns received so far, time-to-first-token), so the dashboard can show
+-- progress while the analysis row is still 'processing'.
+
+ALTER TABLE public.skin_analyses
+ADD COLUMN IF NOT EXISTS progress jsonb;
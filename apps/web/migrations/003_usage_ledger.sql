@@ -0,0 +1,26 @@
+-- Usage ledger
+-- One row per LLM / image-generation call made by run_analysis.py, generate_recommendations.py
+-- and generate_avatar.py: tokens and estimated cost per user, analysis and run (run_id is the
+-- trace_id of the run's spans in logs/ai_scripts.log).
+
+create table if not exists public.usage_ledger (
+  id bigint generated always as identity primary key,
+  run_id text not null,
+  script text not null,
+  user_id text references public.users(id) on delete set null,
+  analysis_id uuid references public.skin_analyses(id) on delete set null,
+  stage text not null, -- e.g. 'analysis', 'generator', 'reviewer', 'avatar'
+  model text not null,
+  input_tokens integer not null default 0,
+  cache_read_tokens integer not null default 0,
+  output_tokens integer not null default 0,
+  requests integer not null default 0,
+  cost_usd numeric(12, 6), -- null when the model has no known price
+  created_at timestamptz default now()
+);
+
+create index if not exists usage_ledger_user_created_idx on public.usage_ledger (user_id, created_at);
+create index if not exists usage_ledger_analysis_idx on public.usage_ledger (analysis_id);
+
+alter table public.usage_ledger enable row level security;
+create policy "Admins can view usage" on public.usage_ledger for select using (public.is_admin());
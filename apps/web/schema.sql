@@ -46,6 +46,7 @@ create table if not exists public.skin_analyses (
   image_urls text[],
   status public.analysis_status default 'pending',
   error_message text,
+  progress jsonb, -- partial progress from streamed runs (see migrations/002_analysis_progress.sql)
   created_at timestamptz default now()
 );
 
@@ -346,3 +347,27 @@ create table if not exists public.product_purchase_options (
 alter table public.product_purchase_options enable row level security;
 create policy "Admins can manage purchase options" on public.product_purchase_options for all using (public.is_admin());
 create policy "Everyone can view active purchase options" on public.product_purchase_options for select using (is_active = true OR public.is_admin());
+
+-- 16. Usage Ledger (see migrations/003_usage_ledger.sql)
+-- Tokens and estimated cost of every LLM / image-generation call, per user, analysis and run.
+create table if not exists public.usage_ledger (
+  id bigint generated always as identity primary key,
+  run_id text not null,
+  script text not null,
+  user_id text references public.users(id) on delete set null,
+  analysis_id uuid references public.skin_analyses(id) on delete set null,
+  stage text not null,
+  model text not null,
+  input_tokens integer not null default 0,
+  cache_read_tokens integer not null default 0,
+  output_tokens integer not null default 0,
+  requests integer not null default 0,
+  cost_usd numeric(12, 6),
+  created_at timestamptz default now()
+);
+
+create index if not exists usage_ledger_user_created_idx on public.usage_ledger (user_id, created_at);
+create index if not exists usage_ledger_analysis_idx on public.usage_ledger (analysis_id);
+
+alter table public.usage_ledger enable row level security;
+create policy "Admins can view usage" on public.usage_ledger for select using (public.is_admin());
@@ -0,0 +1,155 @@
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "httpx",
+#     "beautifulsoup4",
+#     "lxml"
+# ]
+# ///
+"""
+bench_incidecoder_parse.py
+
+Benchmarks incidecoder product page extraction with the single-pass `PageIndex` against the
+original per-extractor tree scans over saved pages, and checks that both produce
+byte-identical JSONL records (ignoring the `_trace.scraped_iso` timestamp). The scans only
+live here, as `ScanPageIndex`: a PageIndex whose lookups each walk the tree like the
+extractors used to, including the "Skim through" header/table/rows scan that both skim
+extractors repeated.
+
+Pages come from the scraper page cache (populated by any `incidecoder_to_jsonl.py` run with
+caching on) or from a directory of saved .html files named after the product slug.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+from bs4 import BeautifulSoup
+from incidecoder_to_jsonl import DEFAULT_PARSER, PageIndex, parse_indexed_page
+from scrape_lib import DEFAULT_CACHE_DIR, HttpCache
+
+BASE_URL = "https://incidecoder.com"
+
+
+class _IdScan:
+    """`ids` mapping that runs a select_one per lookup."""
+
+    def __init__(self, soup: BeautifulSoup):
+        self.soup = soup
+
+    def get(self, tag_id: str):
+        return self.soup.select_one(f"#{tag_id}")
+
+
+class _HeaderScan:
+    """`headers` mapping that runs a full-tree find per lookup and remembers the last hit per label."""
+
+    def __init__(self, soup: BeautifulSoup):
+        self.soup = soup
+        self.last: dict[str, Any] = {}
+
+    def get(self, label: str):
+        header = self.soup.find(lambda t: t.name in ["h2", "h3"] and label in t.get_text())
+        self.last[label] = header
+        return header
+
+
+class ScanPageIndex(PageIndex):
+    """
+    The original per-extractor lookups: every header, id and anchor lookup scans the tree, and
+    both "Skim through" extractors find the header, its table and the table rows again, as the
+    baseline extractors each did on their own.
+    """
+
+    def __init__(self, soup: BeautifulSoup):
+        self.soup = soup
+        self.headers = _HeaderScan(soup)
+        self.ids = _IdScan(soup)
+        self.jsonld = soup.find_all("script", type="application/ld+json")
+        self.brand_anchor = soup.select_one('a[href^="/brand/"], a[href^="/brands/"]')
+        self._skim_table = None
+
+    @property
+    def skim_table(self):
+        # Each extractor checks headers.get("Skim through") first, then reads the table below it
+        header = self.headers.last.get("Skim through")
+        self._skim_table = header.find_next("table") if header else None
+        return self._skim_table
+
+    @property
+    def skim_rows(self):
+        return self._skim_table.find_all("tr") if self._skim_table else []
+
+
+MODES = {"multi-pass": ScanPageIndex, "single-pass": PageIndex}
+
+
+def load_pages(cache_dir: str | None, html_dir: str | None) -> list[tuple[str, str]]:
+    """Returns (url, html) pairs for every saved incidecoder product page."""
+    pages: list[tuple[str, str]] = []
+    if html_dir:
+        for path in sorted(Path(html_dir).rglob("*.html")):
+            pages.append((f"{BASE_URL}/products/{path.stem}", path.read_text(encoding="utf-8")))
+    if cache_dir:
+        for entry in HttpCache(cache_dir, offline=True).iter_entries():
+            if "incidecoder.com" in entry.url and "/products/" in entry.url:
+                pages.append((entry.url, entry.body))
+    return pages
+
+
+def serialize(html: str, url: str, parser: str, index: type[PageIndex]) -> str:
+    record, rows = parse_indexed_page(index(BeautifulSoup(html, features=parser)), url)
+    record["_trace"].pop("scraped_iso", None)
+    return json.dumps([record, rows], ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark single-pass incidecoder product page extraction.")
+    parser.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR, help="Scraper page cache to read from.")
+    parser.add_argument("--html-dir", type=str, help="Optional directory of saved .html pages.")
+    parser.add_argument(
+        "--parser", choices=["lxml", "html.parser"], default=DEFAULT_PARSER, help="BeautifulSoup backend."
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes per mode (best pass is reported).")
+    args = parser.parse_args()
+
+    pages = load_pages(args.cache_dir, args.html_dir)
+    if not pages:
+        print("No saved incidecoder pages found. Run the scraper once or pass --html-dir.")
+        sys.exit(1)
+    print(f"Loaded {len(pages)} pages.")
+
+    timings: dict[str, float] = {}
+    outputs: dict[str, list[str]] = {}
+    for mode, index in MODES.items():
+        best = float("inf")
+        for _ in range(max(1, args.repeat)):
+            start = time.perf_counter()
+            outputs[mode] = [serialize(html, url, args.parser, index) for url, html in pages]
+            best = min(best, time.perf_counter() - start)
+        timings[mode] = best
+
+    mismatches = [
+        url
+        for (url, _), old, new in zip(pages, outputs["multi-pass"], outputs["single-pass"], strict=True)
+        if old != new
+    ]
+
+    base_time = timings["multi-pass"]
+    print(f"\n{'mode':<12} {'total_s':>9} {'ms/page':>9} {'speedup':>8}")
+    for mode in MODES:
+        total = timings[mode]
+        print(f"{mode:<12} {total:>9.3f} {1000 * total / len(pages):>9.2f} {base_time / total:>7.2f}x")
+
+    for url in mismatches:
+        print(f"[MISMATCH] {url}")
+    print(f"\n{len(pages) - len(mismatches)}/{len(pages)} pages byte-identical.")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
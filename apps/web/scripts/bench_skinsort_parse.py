@@ -0,0 +1,101 @@
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "httpx",
+#     "beautifulsoup4",
+#     "lxml",
+#     "tqdm",
+#     "orjson",
+#     "pydantic-ai",
+#     "python-dotenv"
+# ]
+# ///
+"""
+bench_skinsort_parse.py
+
+Benchmarks the skinsort extraction functions across BeautifulSoup parser backends over saved
+pages, and checks that every backend produces the same output dicts as the html.parser baseline.
+
+Pages come from the scraper page cache (populated by any normal `skinsort_to_jsonl.py` run) or
+from a directory of saved .html files; files under an `ingredients/` subdirectory are parsed as
+ingredient pages, everything else as product pages.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from scrape_lib import DEFAULT_CACHE_DIR, HttpCache
+from skinsort_to_jsonl import BASE_URL, PARSER_CHOICES, extract_ingredient, extract_product
+
+BASELINE_PARSER = "html.parser"
+
+
+def load_pages(cache_dir: str | None, html_dir: str | None) -> list[tuple[str, str]]:
+    """Returns (url, html) pairs for every saved skinsort page."""
+    pages: list[tuple[str, str]] = []
+    if html_dir:
+        for path in sorted(Path(html_dir).rglob("*.html")):
+            kind = "ingredients" if "ingredients" in path.parts else "products"
+            pages.append((f"{BASE_URL}/{kind}/{path.stem}", path.read_text(encoding="utf-8")))
+    if cache_dir:
+        for entry in HttpCache(cache_dir, offline=True).iter_entries():
+            if entry.url.startswith(BASE_URL):
+                pages.append((entry.url, entry.body))
+    return pages
+
+
+def extract(html: str, url: str, parser: str) -> dict:
+    if "/ingredients/" in url:
+        return extract_ingredient(html, url, parser)
+    return extract_product(html, url, parser)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark skinsort HTML extraction across parser backends.")
+    parser.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR, help="Scraper page cache to read from.")
+    parser.add_argument("--html-dir", type=str, help="Optional directory of saved .html pages.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes per backend (best pass is reported).")
+    args = parser.parse_args()
+
+    pages = load_pages(args.cache_dir, args.html_dir)
+    if not pages:
+        print("No saved skinsort pages found. Run the scraper once or pass --html-dir.")
+        sys.exit(1)
+    print(f"Loaded {len(pages)} pages.")
+
+    baseline = [extract(html, url, BASELINE_PARSER) for url, html in pages]
+
+    timings: dict[str, float] = {}
+    mismatches: dict[str, list[str]] = {}
+    for backend in PARSER_CHOICES:
+        best = float("inf")
+        outputs: list[dict] = []
+        for _ in range(max(1, args.repeat)):
+            start = time.perf_counter()
+            outputs = [extract(html, url, backend) for url, html in pages]
+            best = min(best, time.perf_counter() - start)
+        timings[backend] = best
+        mismatches[backend] = [url for (url, _), out, ref in zip(pages, outputs, baseline, strict=True) if out != ref]
+
+    base_time = timings[BASELINE_PARSER]
+    print(f"\n{'backend':<12} {'total_s':>9} {'ms/page':>9} {'speedup':>8} {'mismatches':>11}")
+    for backend in PARSER_CHOICES:
+        total = timings[backend]
+        print(
+            f"{backend:<12} {total:>9.3f} {1000 * total / len(pages):>9.2f} "
+            f"{base_time / total:>7.2f}x {len(mismatches[backend]):>11}"
+        )
+
+    failed = False
+    for backend, urls in mismatches.items():
+        for url in urls:
+            failed = True
+            print(f"[MISMATCH] {backend}: {url}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,14 +19,15 @@ import time
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
+from pydantic_ai.usage import RunUsage
 
 # Import shared lib
 try:
-    from skin_lib import get_supabase_client, setup_logger
+    from skin_lib import UsageLedger, get_supabase_client, setup_logger, setup_tracing, trace_span
 except ImportError:
     # Handle running from root or scripts dir
     sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-    from skin_lib import get_supabase_client, setup_logger
+    from skin_lib import UsageLedger, get_supabase_client, setup_logger, setup_tracing, trace_span
 
 # Load environment variables
 load_dotenv(".env.local")
@@ -51,7 +52,20 @@ Shoulders, chest, torso, body, clothes, shirt, collar, jacket, suit, necktie. Fl
 """
 
 
-def generate_avatar(client, image_path, output_path):
+def usage_from_metadata(metadata: types.GenerateContentResponseUsageMetadata | None) -> RunUsage | None:
+    """google-genai usage metadata as a pydantic-ai RunUsage, for the usage ledger."""
+    if metadata is None:
+        return None
+    return RunUsage(
+        requests=1,
+        input_tokens=metadata.prompt_token_count or 0,
+        cache_read_tokens=metadata.cached_content_token_count or 0,
+        # Thinking tokens are billed as output
+        output_tokens=(metadata.candidates_token_count or 0) + (metadata.thoughts_token_count or 0),
+    )
+
+
+def generate_avatar(client, image_path, output_path, ledger: UsageLedger | None = None):
     """Generates an avatar using Google GenAI Image-to-Image."""
 
     logger.info(f"Generating avatar from {image_path}...")
@@ -89,11 +103,14 @@ def generate_avatar(client, image_path, output_path):
                 ],
             )
 
-            response = client.models.generate_content(
-                model=model,
-                contents=contents,
-                config=generate_content_config,
-            )
+            with trace_span("llm.avatar", attempt=attempt + 1) as span:
+                response = client.models.generate_content(
+                    model=model,
+                    contents=contents,
+                    config=generate_content_config,
+                )
+                if ledger is not None:
+                    ledger.record("avatar", f"google-gla:{model}", usage_from_metadata(response.usage_metadata), span)
 
             if (
                 response.candidates is None
@@ -143,6 +160,7 @@ def main():
 
     user_id = args.user_id
     supabase = get_supabase_client()
+    run_id = setup_tracing("generate_avatar", user_id=user_id)
 
     # 1. Check if avatar already exists
     if not args.overwrite:
@@ -218,7 +236,9 @@ def main():
     output_filename = f"{user_id}_avatar.png"
     output_path = os.path.join(temp_dir, output_filename)
 
-    success = generate_avatar(client, smiling_path, output_path)
+    ledger = UsageLedger(supabase, run_id, "generate_avatar", user_id=user_id)
+    success = generate_avatar(client, smiling_path, output_path, ledger)
+    logger.info(f"Usage: {ledger.summary()}.")
 
     if not success:
         logger.error("Failed to generate avatar.")
@@ -6,7 +6,11 @@
 #     "python-dotenv",
 #     "sentence-transformers",
 #     "loguru",
-#     "supabase"
+#     "supabase",
+#     "httpx[http2]",
+#     "beautifulsoup4",
+#     "numpy",
+#     "scipy"
 # ]
 # ///
 """
@@ -17,25 +21,42 @@ system with a feedback loop.
 """
 
 import argparse
+import asyncio
 import json
 import sys
-import time
+from collections.abc import Callable
 from typing import Any
 
 from dotenv import load_dotenv
+from ingredient_conflicts import ConflictIndex, format_conflicts_for_prompt
+from ingredient_grounding import IngredientAliasIndex, ground_products
+from product_rerank import fetch_product_stats, rerank_products
 from pydantic_ai import Agent
+from pydantic_ai.exceptions import UnexpectedModelBehavior
+from pydantic_ai.usage import RunUsage
+from recommendation_rules import validate_recommendations
 from sentence_transformers import SentenceTransformer
 from skin_lib import (
+    AnalysisProgress,
     Recommendations,
     ReviewResult,
     SkincarePhilosophy,
+    UsageLedger,
     create_agent,
     distill_analysis_for_prompt,
+    estimate_tokens,
+    fetch_ingredient_rows,
     format_products_as_markdown,
+    format_products_compact,
     get_supabase_client,
     load_json_context,
     load_system_prompt,
+    log_cache_usage,
+    prompt_cache_key,
+    run_agent_streaming,
     setup_logger,
+    setup_tracing,
+    trace_span,
 )
 from supabase import Client
 
@@ -73,7 +94,8 @@ def get_all_product_categories(client: Client) -> list[str]:
     """Extracts all distinct, non-null product categories from the database."""
     logger.info("Extracting distinct product categories from database...")
     try:
-        response = client.rpc("get_distinct_categories").execute()
+        with trace_span("rpc.get_distinct_categories"):
+            response = client.rpc("get_distinct_categories").execute()
         if not response.data:
             logger.warning("No categories found in products_1 table.")
             return []
@@ -133,7 +155,8 @@ def find_relevant_products(
         # Log the first query to verify structure
         logger.debug(f"Query for '{category}': {category_query}")
 
-        query_embedding = model.encode(category_query).tolist()
+        with trace_span("embedding.encode", category=category):
+            query_embedding = model.encode(category_query).tolist()
 
         try:
             # Revert to simpler call: disable strict ingredient filtering at DB level
@@ -145,7 +168,9 @@ def find_relevant_products(
                 "match_count": 15,  # Increased from 7 to 15 for variety
                 "p_active_ingredients": None,  # Pass None to use vector search only
             }
-            response = supabase.rpc("match_products_by_category", rpc_params).execute()
+            with trace_span("rpc.match_products_by_category", category=category) as span:
+                response = supabase.rpc("match_products_by_category", rpc_params).execute()
+                span.set(rows=len(response.data))
 
             for product in response.data:
                 if product["url"] not in all_relevant_products:
@@ -162,8 +187,86 @@ def find_relevant_products(
     return list(all_relevant_products.values())
 
 
-def main():
-    """Main function to generate and validate recommendations."""
+async def speculative_round(
+    generators: list[tuple[Agent, Any, str]],
+    reviewer_agent: Agent,
+    reviewer_settings: Any,
+    reviewer_model: str,
+    message_content: list[str],
+    rule_check: Callable[[Recommendations], list[str]],
+    review_prompt: Callable[[Recommendations], list[str]],
+    stats: dict[str, int],
+    ledger: UsageLedger,
+) -> tuple[Recommendations | None, list[str]]:
+    """
+    Runs one generate -> rule check -> review pipeline per generator concurrently. Returns the
+    first approved routine (cancelling the candidates still in flight), or None plus the
+    combined feedback of every rejected candidate. Only a candidate whose model produced no
+    valid output counts as rejected; transport, provider and loop errors propagate.
+    """
+
+    async def candidate(
+        idx: int, agent: Agent, settings: Any, model_str: str
+    ) -> tuple[int, Recommendations | None, list[str]]:
+        # Usage accumulates into a RunUsage we own, so a candidate cancelled (or failed) mid-run
+        # still books every request it completed before the next attempt's budget check
+        usage = RunUsage()
+        with trace_span("llm.generator", candidate=idx + 1) as span:
+            try:
+                result = await agent.run(message_content, model_settings=settings, usage=usage)
+            finally:
+                ledger.record("generator", model_str, usage, span)
+        stats["generator_calls"] += 1
+        log_cache_usage(f"generator #{idx + 1}", result.usage(), stats)
+        routine = result.output
+        violations = rule_check(routine)
+        if violations:
+            stats["rule_rejections"] += 1
+            return idx, None, violations
+        usage = RunUsage()
+        with trace_span("llm.reviewer", candidate=idx + 1) as span:
+            try:
+                result = await reviewer_agent.run(review_prompt(routine), model_settings=reviewer_settings, usage=usage)
+            finally:
+                ledger.record("reviewer", reviewer_model, usage, span)
+        stats["reviewer_calls"] += 1
+        log_cache_usage(f"reviewer #{idx + 1}", result.usage(), stats)
+        review = result.output
+        if review.review_status == "approved":
+            logger.info(f"Safety Audit Log: {review.audit_log}")
+            return idx, review.validated_recommendations, []
+        return idx, None, review.review_notes
+
+    tasks = [asyncio.create_task(candidate(i, *generator)) for i, generator in enumerate(generators)]
+    feedback: list[str] = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                idx, approved, notes = await next_done
+            except UnexpectedModelBehavior as e:
+                logger.warning(f"Speculative candidate produced no valid output: {e}")
+                continue
+            if approved is not None:
+                logger.success(f"Candidate {idx + 1} of {len(tasks)} approved first.")
+                return approved, feedback
+            logger.warning(f"Candidate {idx + 1} of {len(tasks)} rejected with {len(notes)} note(s).")
+            feedback.extend(notes)
+    finally:
+        pending = [t for t in tasks if not t.done()]
+        stats["cancelled_candidates"] = stats.get("cancelled_candidates", 0) + len(pending)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    # Candidates often trip over the same issue; repeat each note once
+    return None, list(dict.fromkeys(feedback))
+
+
+async def main():
+    """
+    Main function to generate and validate recommendations. Every agent call is awaited on the
+    one event loop asyncio.run starts: the providers cache an HTTP client bound to the loop it
+    was first used on, so mixing run_sync with separate asyncio.run calls breaks later requests.
+    """
     parser = argparse.ArgumentParser(description="Generate and validate skin care recommendations from an analysis.")
     parser.add_argument(
         "--model", type=str, required=True, help="The model for the generator (e.g., 'google:gemini-1.5-pro')."
@@ -180,14 +283,72 @@ def main():
     parser.add_argument("--reasoning-effort", type=str, choices=["low", "medium", "high", "auto"])
     parser.add_argument("--context-file", type=str, help="Optional path to a JSON file containing user context.")
     parser.add_argument("--analysis-id", type=str, help="The specific analysis ID to generate recommendations for.")
+    parser.add_argument(
+        "--context-budget",
+        type=int,
+        help="Approximate token budget for the product candidates in the generator prompt. "
+        "Uses the compact formatter when set; the full product cards otherwise.",
+    )
+    parser.add_argument(
+        "--rerank-top-n",
+        type=int,
+        default=8,
+        help="Products kept per category after MMR reranking (0 keeps every retrieved product).",
+    )
+    parser.add_argument(
+        "--mmr-diversity",
+        type=float,
+        default=0.3,
+        help="MMR trade-off: 0 ranks purely by relevance, higher values penalise near-duplicates more.",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the generator's structured output, recording time-to-first-token and writing "
+        "partial routine progress to skin_analyses.progress. With --speculative only the attempt number "
+        "and completion are written.",
+    )
+    parser.add_argument(
+        "--speculative",
+        type=int,
+        default=1,
+        help="Generate and review this many candidates concurrently per attempt; the first approved "
+        "routine wins and the rest are cancelled (1 = sequential).",
+    )
+    parser.add_argument(
+        "--speculative-models",
+        type=str,
+        nargs="+",
+        help="Generator models the speculative candidates cycle through. Defaults to --model.",
+    )
+    parser.add_argument(
+        "--speculative-temperatures",
+        type=float,
+        nargs="+",
+        help="Temperatures the speculative candidates cycle through. Defaults to the model default.",
+    )
+    parser.add_argument(
+        "--max-run-tokens",
+        type=int,
+        help="Token budget (input + output, all agents) for the run; no new attempt starts once it "
+        "is used up or the previous attempt's spend would exceed it.",
+    )
+    parser.add_argument(
+        "--max-run-cost",
+        type=float,
+        help="Estimated cost budget in USD for the run, enforced like --max-run-tokens.",
+    )
     args = parser.parse_args()
 
     reviewer_model_str = args.reviewer_model or args.model
     logger.info(f"Starting recommendations generation for User: {args.user_id}")
     logger.info(f"Generator: {args.model} | Reviewer: {reviewer_model_str}")
 
+    run_id = setup_tracing("generate_recommendations", user_id=args.user_id, analysis_id=args.analysis_id)
+
     # --- Initialize Model ---
-    model = SentenceTransformer("all-MiniLM-L6-v2")
+    with trace_span("embedding.load_model"):
+        model = SentenceTransformer("all-MiniLM-L6-v2")
 
     # --- Load User Analysis ---
     supabase = get_supabase_client()
@@ -201,7 +362,8 @@ def main():
         logger.warning("No analysis ID provided. Defaulting to latest analysis for user.")
         analysis_query = analysis_query.eq("user_id", args.user_id).order("created_at", desc=True)
 
-    analysis_response = analysis_query.limit(1).execute()
+    with trace_span("db.select", table="skin_analyses"):
+        analysis_response = analysis_query.limit(1).execute()
 
     if not analysis_response.data:
         logger.error(
@@ -214,6 +376,16 @@ def main():
     analysis_data = full_analysis_record["analysis_data"]
     logger.success(f"Loaded analysis {analysis_id}.")
 
+    ledger = UsageLedger(
+        supabase,
+        run_id,
+        "generate_recommendations",
+        user_id=args.user_id,
+        analysis_id=analysis_id,
+        max_tokens=args.max_run_tokens,
+        max_cost_usd=args.max_run_cost,
+    )
+
     # --- Load User Context (Intake Data) ---
     # Priority:
     # 1. Explicit --context-file argument (Legacy/Manual Override)
@@ -227,7 +399,10 @@ def main():
     else:
         logger.info(f"Fetching intake submission from DB for user {args.user_id}...")
         try:
-            intake_res = supabase.table("intake_submissions").select("*").eq("user_id", args.user_id).limit(1).execute()
+            with trace_span("db.select", table="intake_submissions"):
+                intake_res = (
+                    supabase.table("intake_submissions").select("*").eq("user_id", args.user_id).limit(1).execute()
+                )
             if intake_res.data:
                 raw_context = intake_res.data[0]
                 # Filter out technical fields to keep context clean for the LLM
@@ -253,15 +428,20 @@ def main():
         analysis_summary += "\n\n**Patient Lifestyle & Constraints (User Context):**\n"
         analysis_summary += json.dumps(user_context, indent=2)
 
-    strategist_llm, strategist_settings = create_agent(args.model, args.api_key, None)
-    strategist_agent = Agent(
-        strategist_llm, output_type=SkincarePhilosophy, instructions=load_system_prompt(args.philosophy_prompt)
+    philosophy_prompt = load_system_prompt(args.philosophy_prompt)
+    strategist_llm, strategist_settings = create_agent(
+        args.model, args.api_key, None, cache_key=prompt_cache_key(philosophy_prompt)
     )
-
-    start_time = time.time()
-    philosophy = strategist_agent.run_sync([analysis_summary], model_settings=strategist_settings).output
-    end_time = time.time()
-    logger.success(f"Generated skincare philosophy in {end_time - start_time:.2f}s.")
+    strategist_agent = Agent(strategist_llm, output_type=SkincarePhilosophy, instructions=philosophy_prompt)
+
+    # Token / prompt-cache totals across every agent call of the run
+    usage_totals: dict[str, int] = {}
+    with trace_span("llm.strategist") as span:
+        philosophy_result = await strategist_agent.run([analysis_summary], model_settings=strategist_settings)
+        ledger.record("strategist", args.model, philosophy_result.usage(), span)
+    log_cache_usage("strategist", philosophy_result.usage(), usage_totals)
+    philosophy = philosophy_result.output
+    logger.success(f"Generated skincare philosophy in {span.duration_s:.2f}s.")
     logger.info(f"Philosophy: {philosophy.model_dump_json(indent=2)}")
 
     # --- RAG (Broad Search) ---
@@ -272,36 +452,143 @@ def main():
 
     relevant_products = find_relevant_products(analysis_data, philosophy, model, all_categories)
 
+    # --- Ingredient Indexes (aliases for grounding, families for conflict checks) ---
+    try:
+        ingredient_rows = fetch_ingredient_rows(
+            supabase, "ingredient_slug, name, description, tags, what_it_does, cosing_data"
+        )
+        logger.success(f"Loaded {len(ingredient_rows)} ingredients for the alias and conflict indexes.")
+    except Exception as e:
+        logger.warning(f"Could not load ingredients_1, falling back to active-ingredient labels only: {e}")
+        ingredient_rows = []
+    alias_index = IngredientAliasIndex.from_ingredient_rows(ingredient_rows)
+    conflict_index = ConflictIndex.from_ingredient_rows(ingredient_rows)
+
     # --- Grounding Step: Tag products with matched key ingredients ---
     logger.info("Grounding retrieved products with philosophy's key ingredients...")
-    key_ingredients_set = set(ing.lower() for ing in philosophy.key_ingredients_to_target)
-    for product in relevant_products:
-        product_actives_set = set(ing.lower() for ing in product.get("active_ingredients", []))
-        matched_ingredients = list(key_ingredients_set.intersection(product_actives_set))
-        product["matched_key_ingredients"] = matched_ingredients
-    logger.success("Product grounding complete.")
+    ground_products(relevant_products, philosophy.key_ingredients_to_target, alias_index)
+    grounded = sum(1 for p in relevant_products if p["matched_key_ingredients"])
+    logger.success(f"Product grounding complete: {grounded}/{len(relevant_products)} products match a key ingredient.")
+
+    # --- Rerank: relevance + rating + key-ingredient overlap, MMR for diversity ---
+    if args.rerank_top_n > 0:
+        try:
+            with trace_span("db.select", table="products_1"):
+                product_stats = fetch_product_stats(supabase, [p["product_slug"] for p in relevant_products])
+        except Exception as e:
+            logger.warning(f"Could not fetch product ratings for reranking: {e}")
+            product_stats = {}
+        for product in relevant_products:
+            product.update({k: v for k, v in product_stats.get(product["product_slug"], {}).items() if v is not None})
+        before = len(relevant_products)
+        with trace_span("rerank", candidates=before):
+            relevant_products = rerank_products(
+                relevant_products,
+                len(philosophy.key_ingredients_to_target),
+                top_n=args.rerank_top_n,
+                diversity=args.mmr_diversity,
+                model=model,
+            )
+        logger.success(f"Reranked candidates: kept {len(relevant_products)} of {before} products.")
+
+    products_by_slug = {p["product_slug"]: p for p in relevant_products if p.get("product_slug")}
+
+    # --- Product Context (identical on every attempt, so formatted once) ---
+    if args.context_budget:
+        products_context, context_tokens = format_products_compact(relevant_products, args.context_budget)
+        if context_tokens > args.context_budget:
+            logger.warning(
+                f"Product context (~{context_tokens} tokens) exceeds --context-budget {args.context_budget}; "
+                "product headers are never dropped."
+            )
+    else:
+        products_context = format_products_as_markdown(relevant_products)
+        context_tokens = estimate_tokens(products_context)
+    logger.info(f"Product context: {len(relevant_products)} products, ~{context_tokens} tokens.")
 
     # --- Agent Configuration ---
     logger.info("Configuring Generator and Reviewer agents...")
-    generator_llm, generator_settings = create_agent(args.model, args.api_key, args.reasoning_effort)
-    reviewer_llm, reviewer_settings = create_agent(reviewer_model_str, args.api_key, None)
-
     top_concerns_str = ", ".join(analysis_data.get("analysis", {}).get("top_concerns", [])).replace("_", " ")
     raw_prompt = load_system_prompt(args.recommendation_prompt)
     # The available_categories placeholder is no longer needed as the agent gets a pre-filtered list
     generator_prompt = raw_prompt.format(top_concerns=top_concerns_str)
+    reviewer_prompt = load_system_prompt(args.reviewer_prompt)
 
-    generator_agent = Agent(generator_llm, output_type=Recommendations, instructions=generator_prompt)
-    reviewer_agent = Agent(
-        reviewer_llm, output_type=ReviewResult, instructions=load_system_prompt(args.reviewer_prompt)
+    # The system prompts are identical for every user; keyed so providers can serve them from cache
+    generator_cache_key = prompt_cache_key(generator_prompt)
+    generator_llm, generator_settings = create_agent(
+        args.model, args.api_key, args.reasoning_effort, cache_key=generator_cache_key
     )
+    reviewer_llm, reviewer_settings = create_agent(
+        reviewer_model_str, args.api_key, None, cache_key=prompt_cache_key(reviewer_prompt)
+    )
+
+    generator_agent = Agent(generator_llm, output_type=Recommendations, instructions=generator_prompt)
+    reviewer_agent = Agent(reviewer_llm, output_type=ReviewResult, instructions=reviewer_prompt)
+
+    speculative_generators = []
+    if args.speculative > 1:
+        models = args.speculative_models or [args.model]
+        temperatures = args.speculative_temperatures or [None]
+        for i in range(args.speculative):
+            model_str = models[i % len(models)]
+            llm, settings = create_agent(model_str, args.api_key, args.reasoning_effort, cache_key=generator_cache_key)
+            if temperatures[i % len(temperatures)] is not None:
+                settings = {**settings, "temperature": temperatures[i % len(temperatures)]}
+            speculative_generators.append(
+                (Agent(llm, output_type=Recommendations, instructions=generator_prompt), settings, model_str)
+            )
+        logger.info(f"Speculative mode: {args.speculative} concurrent candidates per attempt.")
+        if args.stream:
+            logger.warning("Speculative candidates are not streamed; --stream only reports per-attempt progress.")
     logger.success("Agents configured.")
 
+    def review_prompt(routine: Recommendations) -> list[str]:
+        return [
+            "Here is the Skincare Philosophy that must be followed:",
+            philosophy.model_dump_json(indent=2),
+            "Here is the generated routine to review:",
+            json.dumps(routine.model_dump(), indent=2),
+            format_conflicts_for_prompt(conflict_index.check_routine(routine.routine, products_by_slug)),
+        ]
+
+    def rule_check(routine: Recommendations) -> list[str]:
+        return validate_recommendations(routine, relevant_products, philosophy, conflict_index)
+
     # --- Multi-Agent Generation and Review Loop ---
     feedback_history = []
     final_recommendations = None
+    # Run stats: a routine rejected by the local rule engine skips its reviewer call
+    stats = {"generator_calls": 0, "reviewer_calls": 0, "rule_rejections": 0, "cancelled_candidates": 0}
+    stats.update(usage_totals)
+    progress = AnalysisProgress(supabase, analysis_id, "recommendations") if args.stream else None
+
+    static_prefix = [
+        "Here is a curated list of relevant products based on the philosophy:",
+        products_context,
+        "Here is the skin analysis:",
+        analysis_summary,
+        "Here is the strategic Skincare Philosophy to follow:",
+        philosophy.model_dump_json(indent=2),
+    ]
+    if user_context:
+        static_prefix.insert(
+            2, f"Here is the user's intake/context (Budget, Habits, etc.):\n{json.dumps(user_context, indent=2)}"
+        )
 
+    # The previous attempt's spend is the estimate for the next one: stop before an attempt
+    # that would overrun the run's budget rather than after it
+    budget_stop = None
+    attempt_start = (ledger.tokens, ledger.cost_usd)
+    last_attempt = (0, 0.0)
     for attempt in range(MAX_RETRIES):
+        if attempt:
+            last_attempt = (ledger.tokens - attempt_start[0], ledger.cost_usd - attempt_start[1])
+            attempt_start = (ledger.tokens, ledger.cost_usd)
+        budget_stop = ledger.over_budget(*last_attempt)
+        if budget_stop:
+            logger.error(f"Stopping before attempt {attempt + 1}: {budget_stop}.")
+            break
         logger.info(f"--- Attempt {attempt + 1} of {MAX_RETRIES} ---")
 
         # --- Construct Generator Message ---
@@ -319,50 +606,94 @@ def main():
 
         logger.info("--- End of Diagnostic Data ---")
 
-        message_content = [
-            "Here is the skin analysis:",
-            analysis_summary,
-            "Here is the strategic Skincare Philosophy to follow:",
-            philosophy.model_dump_json(indent=2),
-            "Here is a curated list of relevant products based on the philosophy:",
-            format_products_as_markdown(relevant_products),
-        ]
-
-        if user_context:
-            message_content.insert(
-                1, f"Here is the user's intake/context (Budget, Habits, etc.):\n{json.dumps(user_context, indent=2)}"
-            )
+        # Identical on every attempt and kept in front, so retries hit the provider's prefix cache;
+        # only the feedback appended below changes
+        message_content = list(static_prefix)
 
         if feedback_history:
             message_content.append("Previous attempts were rejected. Please correct the following issues:")
             message_content.append("\n".join(feedback_history))
 
+        # --- Speculative Mode: K candidates in parallel, first approved wins ---
+        if speculative_generators:
+            if progress:
+                progress.update(attempt=attempt + 1, candidates=len(speculative_generators))
+            with trace_span("speculative_round", attempt=attempt + 1, candidates=len(speculative_generators)) as span:
+                approved, notes = await speculative_round(
+                    speculative_generators,
+                    reviewer_agent,
+                    reviewer_settings,
+                    reviewer_model_str,
+                    message_content,
+                    rule_check,
+                    review_prompt,
+                    stats,
+                    ledger,
+                )
+                span.set(approved=approved is not None)
+            logger.info(f"Speculative round finished in {span.duration_s:.2f}s.")
+            if approved is not None:
+                logger.success(f"Routine approved on attempt {attempt + 1}. Validation passed.")
+                if progress:
+                    progress.update(attempt=attempt + 1, complete=True)
+                final_recommendations = approved
+                break
+            logger.warning(f"All {len(speculative_generators)} candidates rejected on attempt {attempt + 1}.")
+            for note in notes:
+                logger.info(f"- {note}")
+            feedback_history.extend(notes)
+            continue
+
         # --- Run Generator Agent ---
         logger.info("Running Generator Agent...")
-        start_time = time.time()
-        generation_result = generator_agent.run_sync(message_content, model_settings=generator_settings)
-        end_time = time.time()
-        logger.success(f"Generation completed in {end_time - start_time:.2f}s.")
-
-        generated_routine = generation_result.output
+        with trace_span("llm.generator", attempt=attempt + 1, stream=progress is not None) as span:
+            if progress:
+
+                def report(partial: dict, attempt: int = attempt):
+                    routine = partial.get("routine") or {}
+                    steps = {k: len(v) for k, v in routine.items() if isinstance(v, list)}
+                    progress.update(attempt=attempt + 1, sections=list(partial), routine_steps=steps)
+
+                generated_routine, timing = await run_agent_streaming(
+                    generator_agent, message_content, generator_settings, on_progress=report
+                )
+                if timing.ttft_s is not None:
+                    logger.info(f"Generator time to first token: {timing.ttft_s:.2f}s.")
+                    span.set(ttft_s=round(timing.ttft_s, 3))
+                usage = timing.usage
+            else:
+                generation_result = await generator_agent.run(message_content, model_settings=generator_settings)
+                usage = generation_result.usage()
+                generated_routine = generation_result.output
+            ledger.record("generator", args.model, usage, span)
+        log_cache_usage("generator", usage, stats)
+        stats["generator_calls"] += 1
+        logger.success(f"Generation completed in {span.duration_s:.2f}s.")
+
+        # --- Deterministic Pre-Review ---
+        violations = rule_check(generated_routine)
+        if violations:
+            stats["rule_rejections"] += 1
+            logger.warning(f"Routine failed {len(violations)} rule check(s) on attempt {attempt + 1}; skipping review.")
+            for note in violations:
+                logger.info(f"- {note}")
+            feedback_history.extend(violations)
+            continue
 
         # --- Run Reviewer Agent ---
         logger.info("Running Reviewer Agent...")
-        start_time = time.time()
-        review_result = reviewer_agent.run_sync(
-            [
-                "Here is the Skincare Philosophy that must be followed:",
-                philosophy.model_dump_json(indent=2),
-                "Here is the generated routine to review:",
-                json.dumps(generated_routine.model_dump(), indent=2),
-            ],
-            model_settings=reviewer_settings,
-        ).output
-        end_time = time.time()
-        logger.success(f"Review completed in {end_time - start_time:.2f}s.")
+        with trace_span("llm.reviewer", attempt=attempt + 1) as span:
+            review_run = await reviewer_agent.run(review_prompt(generated_routine), model_settings=reviewer_settings)
+            ledger.record("reviewer", reviewer_model_str, review_run.usage(), span)
+        stats["reviewer_calls"] += 1
+        log_cache_usage("reviewer", review_run.usage(), stats)
+        review_result = review_run.output
+        logger.success(f"Review completed in {span.duration_s:.2f}s.")
 
         if review_result.review_status == "approved":
             logger.success(f"Routine approved on attempt {attempt + 1}. Validation passed.")
+            if progress:
+                progress.update(attempt=attempt + 1, complete=True)
             logger.info(f"Safety Audit Log: {review_result.audit_log}")
             final_recommendations = review_result.validated_recommendations
             break
@@ -373,18 +704,35 @@ def main():
                 logger.info(f"- {note}")
             feedback_history.extend(review_result.review_notes)
 
+    logger.info(
+        f"Run stats: {stats['generator_calls']} generator call(s), {stats['reviewer_calls']} reviewer call(s), "
+        f"{stats['rule_rejections']} rule-engine rejection(s) ({stats['rule_rejections']} LLM call(s) saved)"
+        + (f", {stats['cancelled_candidates']} speculative candidate(s) cancelled." if speculative_generators else ".")
+    )
+    input_tokens = stats.get("input_tokens", 0)
+    cached_tokens = stats.get("cache_read_tokens", 0)
+    logger.info(
+        f"Prompt cache: {cached_tokens}/{input_tokens} input tokens served from cache "
+        f"({cached_tokens / input_tokens if input_tokens else 0.0:.0%}), {stats.get('output_tokens', 0)} output tokens."
+    )
+    logger.info(f"Usage: {ledger.summary()}.")
+
     if not final_recommendations:
-        logger.error("Failed to generate a valid routine after all attempts. Exiting.")
+        if budget_stop:
+            logger.error(f"Failed to generate a valid routine within the run budget: {budget_stop}. Exiting.")
+        else:
+            logger.error("Failed to generate a valid routine after all attempts. Exiting.")
         sys.exit(1)
 
     # --- Save to DB and File ---
     output_data = final_recommendations.model_dump()
     try:
         logger.info(f"Saving final recommendations to Supabase for analysis {analysis_id}...")
-        supabase.table("recommendations").upsert(
-            {"skin_analysis_id": analysis_id, "user_id": args.user_id, "recommendations_data": output_data},
-            on_conflict="skin_analysis_id",
-        ).execute()
+        with trace_span("db.write", table="recommendations", op="upsert"):
+            supabase.table("recommendations").upsert(
+                {"skin_analysis_id": analysis_id, "user_id": args.user_id, "recommendations_data": output_data},
+                on_conflict="skin_analysis_id",
+            ).execute()
         logger.success("Successfully saved recommendations to Supabase.")
         logger.info("Recommendations Rationale:")
         logger.info(output_data.get("reasoning", "NOT FOUND?!?!?!"))
@@ -400,7 +748,7 @@ def main():
 
 if __name__ == "__main__":
     try:
-        main()
+        asyncio.run(main())
     except Exception:
         logger.exception("An unexpected error occurred.")
         sys.exit(1)
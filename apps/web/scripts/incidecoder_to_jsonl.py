@@ -1,33 +1,51 @@
 #!/usr/bin/env -S uv run --script
 # /// script
 # requires-python = ">=3.10"
-# dependencies = ["requests", "beautifulsoup4", "lxml"]
+# dependencies = ["httpx[http2]", "beautifulsoup4", "lxml"]
 # ///
 """
 incidecoder_to_jsonl_v3.py
 
 V3 of the INCIDecoder → JSONL scraper, implementing the agreed changes:
 - Provenance-based ingredients merge (skim → overview → explained) + ingredients_provenance
-- Optional ingredient index JSONL emitter (lightweight upsert)
+- Optional ingredient index JSONL emitter (lightweight upsert), or an SQLite store with JSONL export
 - Capture image alt + srcset; include product_url; emit brand_slug & product_slug
 - Full details blurb including hidden "more" content; optional raw HTML
 - CLI flags: --join-ingredients-sources, --include-details-html, --emit-ingredient-index, --product-id-from
+- Single-pass page index feeding every sub-extractor (see bench_incidecoder_parse.py)
+- Batch mode (--urls-file): one pooled async client, per-host rate limit, bounded concurrency, single writer
 """
 
 from __future__ import annotations
 
 import argparse
+import asyncio
 import hashlib
 import json
 import os
 import re
+import sqlite3
 import sys
 import time
 import urllib.parse
+from collections import OrderedDict
+from contextlib import nullcontext
 from urllib import robotparser
 
-import requests
+import httpx
 from bs4 import BeautifulSoup
+from ingredient_families import canonicalize_family, slugify
+from scrape_lib import (
+    DEFAULT_CACHE_DIR,
+    DEFAULT_CACHE_TTL_HOURS,
+    DEFAULT_ROBOTS_CACHE_DIR,
+    DEFAULT_ROBOTS_TTL_HOURS,
+    AsyncHttpClient,
+    CacheMiss,
+    HttpCache,
+    HttpClient,
+    RobotsCache,
+)
 
 # -------------------------
 # Config
@@ -38,58 +56,112 @@ DEFAULT_PARSER = "lxml"  # or "html.parser"
 # Treat these as generic/placeholder brands when JSON-LD is noisy
 GENERIC_BRANDS = {"incidecoder", "decode inci", "inci decoder", "decodeinci"}
 
-# Map long, UI-ish function labels to canonical family slugs
-_CANON_FAMILY = {
-    "skin_identical_ingredient": "skin_identical",
-    "moisturizer_humectant": "humectant",
-    "surfactant_cleansing": "surfactant",
-}
-
-
-def canonicalize_family(slug: str) -> str:
-    return _CANON_FAMILY.get(slug, slug)
-
 
 # -------------------------
 # Helpers
 # -------------------------
-_slug_rx = re.compile("[^a-z0-9]+")
-
-
-def slugify(label: str) -> str:
-    s = (label or "").strip().lower()
-    s = s.replace("&", " and ")
-    s = _slug_rx.sub("_", s)
-    s = s.strip("_")
-    return s or "unknown"
-
-
 def textnorm(s: str | None) -> str:
     return " ".join((s or "").split())
 
 
-def is_allowed_by_robots(url: str, user_agent: str = UA) -> bool:
-    parsed = urllib.parse.urlparse(url)
-    robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
-    rp = robotparser.RobotFileParser()
+def is_allowed_by_robots(
+    url: str,
+    user_agent: str = UA,
+    robots_cache: RobotsCache | None = None,
+    timeout: float = 20.0,
+    client: HttpClient | None = None,
+) -> bool:
+    robots_cache = robots_cache or RobotsCache(root=None)
+    robots_url = RobotsCache.robots_url(url)
     try:
-        rp.set_url(robots_url)
-        rp.read()
-        allowed = rp.can_fetch(user_agent, url)
-        return allowed
+        rp = robots_cache.get(robots_url)
+        if rp is None:
+            with nullcontext(client) if client else HttpClient(timeout=timeout) as http:
+                resp = http.get(robots_url, headers={"User-Agent": user_agent})
+            rp = robots_cache.put(robots_url, resp.status_code, resp.text)
+        return bool(rp and rp.can_fetch(user_agent, url))
     except Exception:
         # Be conservative: fail closed
         return False
 
 
-def fetch_html(url: str, timeout: float = 20.0, user_agent: str = UA) -> str:
-    resp = requests.get(url, headers={"User-Agent": user_agent}, timeout=timeout)
+def fetch_html(
+    url: str,
+    timeout: float = 20.0,
+    user_agent: str = UA,
+    cache: HttpCache | None = None,
+    client: HttpClient | None = None,
+) -> str:
+    cached = None
+    if cache:
+        cached = cache.lookup(url)
+        if cached and cache.is_fresh(cached):
+            return cached.body
+        if cache.offline:
+            raise CacheMiss(url)
+    headers = {"User-Agent": user_agent, **HttpCache.conditional_headers(cached)}
+    with nullcontext(client) if client else HttpClient(timeout=timeout) as http:
+        resp = http.get(url, headers=headers)
+    if resp.status_code == 304 and cached:
+        return cache.revalidated(cached, resp.headers).body
     resp.raise_for_status()
+    if cache:
+        cache.store(url, resp.text, resp.headers)
     return resp.text
 
 
-def parse_jsonld_product(soup: BeautifulSoup) -> tuple[str | None, str | None]:
-    for tag in soup.find_all("script", type="application/ld+json"):
+# Single-pass page index
+
+SECTION_HEADERS = ("Skim through", "Ingredients overview", "Ingredients explained", "Highlights", "Key Ingredients")
+_simple_id_rx = re.compile(r"#[A-Za-z_][A-Za-z0-9_-]*")
+
+
+class PageIndex:
+    """
+    Everything the sub-extractors look up by scanning the whole tree, collected in one
+    traversal: the first h2/h3 containing each section label, the first element for each
+    id, JSON-LD scripts, the first brand anchor and the "Skim through" table rows.
+    Lookups return exactly what soup.find / select_one scans would (bench_incidecoder_parse.py
+    checks this against the scans).
+    """
+
+    def __init__(self, soup: BeautifulSoup):
+        self.soup = soup
+        self.headers: dict[str, object] = {}
+        self.ids: dict[str, object] = {}
+        self.jsonld: list = []
+        self.brand_anchor = None
+        for tag in soup.find_all(True):
+            name = tag.name
+            if name in ("h2", "h3"):
+                text = tag.get_text()
+                for label in SECTION_HEADERS:
+                    if label not in self.headers and label in text:
+                        self.headers[label] = tag
+            elif name == "script":
+                if tag.get("type") == "application/ld+json":
+                    self.jsonld.append(tag)
+            elif name == "a" and self.brand_anchor is None:
+                href = tag.get("href")
+                if href and href.startswith(("/brand/", "/brands/")):
+                    self.brand_anchor = tag
+            tag_id = tag.get("id")
+            if tag_id and tag_id not in self.ids:
+                self.ids[tag_id] = tag
+
+        skim_header = self.headers.get("Skim through")
+        self.skim_table = skim_header.find_next("table") if skim_header else None
+        self.skim_rows = self.skim_table.find_all("tr") if self.skim_table else []
+
+    def select_id(self, selector: str):
+        """select_one for a "#id" selector, served from the index for bare ids."""
+        if _simple_id_rx.fullmatch(selector):
+            return self.ids.get(selector[1:])
+        return self.soup.select_one(selector)
+
+
+def parse_jsonld_product(page: PageIndex) -> tuple[str | None, str | None]:
+    for tag in page.jsonld:
         try:
             data = json.loads(tag.string or "")
         except Exception:
@@ -124,35 +196,24 @@ def fallback_name_brand(soup: BeautifulSoup) -> tuple[str | None, str | None]:
     return brand, name
 
 
-def parse_brand_name_by_ids(soup: BeautifulSoup) -> tuple[str | None, str | None]:
+def parse_brand_name_by_ids(page: PageIndex) -> tuple[str | None, str | None]:
     brand = None
     name = None
-    brand_a = soup.select_one("#product-brand-title a[href]")
+    title = page.ids.get("product-brand-title")
+    brand_a = title.select_one("a[href]") if title else None
     if brand_a:
         brand = textnorm(brand_a.get_text())
-    name_span = soup.select_one("#product-title")
+    name_span = page.ids.get("product-title")
     if name_span:
         name = textnorm(name_span.get_text())
     return brand or None, name or None
 
 
-# Section iter helper
-
-
-def iter_section_nodes(header_tag) -> list[str]:
-    lines: list[str] = []
-    cur = header_tag.find_next_sibling()
-    while cur and cur.name not in ["h2", "h3"]:
-        lines.append(cur.get_text(" ", strip=True))
-        cur = cur.find_next_sibling()
-    return lines
-
-
 # --- Ingredient collectors (with provenance) ---
 
 
-def extract_ingredients_overview(soup: BeautifulSoup) -> list[str]:
-    ing_header = soup.find(lambda t: t.name in ["h2", "h3"] and "Ingredients overview" in t.get_text())
+def extract_ingredients_overview(page: PageIndex) -> list[str]:
+    ing_header = page.headers.get("Ingredients overview")
     out: list[str] = []
     if not ing_header:
         return out
@@ -167,15 +228,13 @@ def extract_ingredients_overview(soup: BeautifulSoup) -> list[str]:
     return out
 
 
-def extract_ingredients_skim(soup: BeautifulSoup) -> list[str]:
-    skim_header = soup.find(lambda t: t.name in ["h2", "h3"] and "Skim through" in t.get_text())
+def extract_ingredients_skim(page: PageIndex) -> list[str]:
     out: list[str] = []
-    if not skim_header:
+    if not page.headers.get("Skim through"):
         return out
-    table = skim_header.find_next("table")
-    if not table:
+    if not page.skim_table:
         return out
-    for row in table.find_all("tr"):
+    for row in page.skim_rows:
         a = row.find("a", href=True)
         if not a:
             continue
@@ -187,8 +246,8 @@ def extract_ingredients_skim(soup: BeautifulSoup) -> list[str]:
     return out
 
 
-def extract_ingredients_explained(soup: BeautifulSoup) -> list[str]:
-    expl_header = soup.find(lambda t: t.name in ["h2", "h3"] and "Ingredients explained" in t.get_text())
+def extract_ingredients_explained(page: PageIndex) -> list[str]:
+    expl_header = page.headers.get("Ingredients explained")
     out: list[str] = []
     if not expl_header:
         return out
@@ -228,23 +287,23 @@ def merge_ingredients_with_provenance(
 # Highlights hashtags
 
 
-def extract_highlights(soup: BeautifulSoup) -> dict[str, bool]:
+def extract_highlights(page: PageIndex) -> dict[str, bool]:
     flags = {"fragrance_free": False, "essential_oil_free": False, "alcohol_free": False}
-    high = soup.find(lambda t: t.name in ["h2", "h3"] and "Highlights" in t.get_text())
+    high = page.headers.get("Highlights")
     if not high:
         return flags
     container = high.find_next()
     texts: list[str] = []
     # Visible hashtag chips
-    for tag in (container or soup).select(".hashtags .hashtag"):
+    for tag in (container or page.soup).select(".hashtags .hashtag"):
         texts.append(tag.get_text(" ", strip=True))
         tt = tag.get("data-tooltip-content")
         if tt and tt.startswith("#"):
-            node = soup.select_one(tt)
+            node = page.select_id(tt)
             if node:
                 texts.append(node.get_text(" ", strip=True))
     # Fallback: any tooltip texts nearby
-    for node in (container or soup).select(".tooltip_templates .ingred-tooltip-text"):
+    for node in (container or page.soup).select(".tooltip_templates .ingred-tooltip-text"):
         texts.append(node.get_text(" ", strip=True))
 
     def norm(x: str) -> str:
@@ -264,22 +323,14 @@ def extract_highlights(soup: BeautifulSoup) -> dict[str, bool]:
             flags["fragrance_free"] = True
             flags["essential_oil_free"] = True
     return flags
-    texts = iter_section_nodes(high)
-    low = " ".join(texts).lower()
-    if "#alcohol-free" in low or "alcohol free" in low:
-        flags["alcohol_free"] = True
-    if "#fragrance & essentialoil-free" in low or "fragrance and essential oil free" in low:
-        flags["fragrance_free"] = True
-        flags["essential_oil_free"] = True
-    return flags
 
 
 # Key Ingredients block → page-derived actives
 
 
-def extract_key_ingredients_from_page(soup: BeautifulSoup) -> list[dict[str, str | None]]:
+def extract_key_ingredients_from_page(page: PageIndex) -> list[dict[str, str | None]]:
     results: list[dict[str, str | None]] = []
-    key_header = soup.find(lambda t: t.name in ["h2", "h3"] and "Key Ingredients" in t.get_text())
+    key_header = page.headers.get("Key Ingredients")
     if not key_header:
         return results
     sect = key_header.find_next()
@@ -355,8 +406,8 @@ def dedupe_actives(actives: list[dict[str, str | None]]) -> list[dict[str, str |
 # Details blurb (visible + hidden)
 
 
-def extract_details_blurb(soup: BeautifulSoup, include_html: bool = False) -> tuple[str | None, str | None]:
-    details = soup.select_one("#product-details")
+def extract_details_blurb(page: PageIndex, include_html: bool = False) -> tuple[str | None, str | None]:
+    details = page.ids.get("product-details")
     if not details:
         return None, None
     text = textnorm(details.get_text(" ", strip=True)) or None
@@ -381,11 +432,11 @@ def _parse_srcset(value: str) -> list[str]:
     return out
 
 
-def extract_image_assets(soup: BeautifulSoup) -> tuple[str | None, str | None, dict[str, list[str]]]:
+def extract_image_assets(page: PageIndex) -> tuple[str | None, str | None, dict[str, list[str]]]:
     image_alt = None
     image_url = None
     srcsets: dict[str, list[str]] = {}
-    pic = soup.select_one("#product-main-image")
+    pic = page.ids.get("product-main-image")
     if not pic:
         return None, None, srcsets
     img = pic.select_one("img[src]")
@@ -403,22 +454,20 @@ def extract_image_assets(soup: BeautifulSoup) -> tuple[str | None, str | None, d
 
 
 def extract_skim_metrics_and_rows(
-    soup: BeautifulSoup,
+    page: PageIndex,
 ) -> tuple[int | None, int | None, int | None, int | None, list[dict], list[str]]:
     warnings: list[str] = []
     irr_vals: list[int] = []
     com_vals: list[int] = []
     rows_for_index: list[dict] = []
     try:
-        skim_header = soup.find(lambda t: t.name in ["h2", "h3"] and "Skim through" in t.get_text())
-        if not skim_header:
+        if not page.headers.get("Skim through"):
             warnings.append("skim_section_missing")
             return None, None, None, None, rows_for_index, warnings
-        table = skim_header.find_next("table")
-        if not table:
+        if not page.skim_table:
             warnings.append("skim_table_missing")
             return None, None, None, None, rows_for_index, warnings
-        for row in table.find_all("tr"):
+        for row in page.skim_rows:
             cells = row.find_all(["td", "th"])
             if len(cells) < 2:
                 continue
@@ -507,8 +556,8 @@ def guess_category_and_usage(name: str) -> tuple[str | None, str | None, str | N
     return None, None, None
 
 
-def parse_brand_anchor_and_slug(soup: BeautifulSoup) -> tuple[str | None, str | None, str | None]:
-    a = soup.select_one('a[href^="/brand/"], a[href^="/brands/"]')
+def parse_brand_anchor_and_slug(page: PageIndex) -> tuple[str | None, str | None, str | None]:
+    a = page.brand_anchor
     if not a or not a.get("href"):
         return None, None, None
     try:
@@ -549,20 +598,39 @@ def parse_product_page(
     include_details_html: bool = False,
     product_id_from: str = "url_hash",
 ) -> tuple[dict, list[dict]]:
-    soup = BeautifulSoup(html, features=parser)
+    # One traversal indexes every header/id lookup the extractors make
+    page = PageIndex(BeautifulSoup(html, features=parser))
+    return parse_indexed_page(
+        page,
+        url,
+        map_json=map_json,
+        join_sources=join_sources,
+        include_details_html=include_details_html,
+        product_id_from=product_id_from,
+    )
 
-    id_brand, id_name = parse_brand_name_by_ids(soup)
 
-    brand, name = parse_jsonld_product(soup)
+def parse_indexed_page(
+    page: PageIndex,
+    url: str,
+    *,
+    map_json: dict[str, str] | None = None,
+    join_sources: list[str] = None,
+    include_details_html: bool = False,
+    product_id_from: str = "url_hash",
+) -> tuple[dict, list[dict]]:
+    id_brand, id_name = parse_brand_name_by_ids(page)
+
+    brand, name = parse_jsonld_product(page)
     brand = brand or id_brand
     name = name or id_name
 
     if not name:
-        fb_brand, fb_name = fallback_name_brand(soup)
+        fb_brand, fb_name = fallback_name_brand(page.soup)
         brand = brand or fb_brand
         name = name or fb_name
 
-    b2_label, b2_url, brand_slug = parse_brand_anchor_and_slug(soup)
+    b2_label, b2_url, brand_slug = parse_brand_anchor_and_slug(page)
     if b2_label:
         if (not brand) or (brand.strip().lower() in GENERIC_BRANDS):
             brand = b2_label
@@ -570,9 +638,9 @@ def parse_product_page(
     if brand and name and name.lower().startswith((brand or "").lower() + " "):
         name = name[len(brand) :].strip()
 
-    skim_list = extract_ingredients_skim(soup)
-    overview_list = extract_ingredients_overview(soup)
-    explained_list = extract_ingredients_explained(soup)
+    skim_list = extract_ingredients_skim(page)
+    overview_list = extract_ingredients_overview(page)
+    explained_list = extract_ingredients_explained(page)
 
     join_sources = join_sources or ["skim", "overview", "explained"]
     use_skim = "skim" in join_sources
@@ -585,12 +653,12 @@ def parse_product_page(
         explained_list if use_explained else [],
     )
 
-    flags = extract_highlights(soup)
-    details_blurb, details_html = extract_details_blurb(soup, include_html=include_details_html)
-    image_url, image_alt, image_srcset = extract_image_assets(soup)
-    irr_max, com_max, irr_med, com_med, skim_rows, warn_list = extract_skim_metrics_and_rows(soup)
+    flags = extract_highlights(page)
+    details_blurb, details_html = extract_details_blurb(page, include_html=include_details_html)
+    image_url, image_alt, image_srcset = extract_image_assets(page)
+    irr_max, com_max, irr_med, com_med, skim_rows, warn_list = extract_skim_metrics_and_rows(page)
 
-    actives_page = extract_key_ingredients_from_page(soup)
+    actives_page = extract_key_ingredients_from_page(page)
     actives_map = augment_with_map(ingredients_inci, map_json)
     actives = dedupe_actives(actives_page + actives_map)
 
@@ -656,10 +724,114 @@ def parse_product_page(
 # -------------------------
 
 
-def load_index(path: str) -> dict[str, dict]:
+class IngredientRecord:
+    """
+    Compact, mutable ingredient index row.
+
+    source_urls is an ordered, bounded set (most recent product first) and functions a set
+    that is only sorted on serialization, so merging a product row is O(1) amortised even
+    for ingredients such as water or glycerin that appear on every product. to_dict()
+    produces the same JSONL row as the original dict-based upsert.
+    """
+
+    __slots__ = (
+        "ingredient_id",
+        "ingredient_slug",
+        "name",
+        "aliases",
+        "functions",
+        "our_take",
+        "first_seen_iso",
+        "last_seen_iso",
+        "source_urls",
+        "extra",
+    )
+
+    def __init__(
+        self,
+        ingredient_id: str,
+        ingredient_slug: str,
+        name: str | None,
+        aliases: list[str],
+        functions: set[str],
+        our_take: str | None,
+        first_seen_iso: str,
+        last_seen_iso: str,
+        source_urls: OrderedDict[str, None],
+        extra: dict | None = None,
+    ):
+        self.ingredient_id = ingredient_id
+        self.ingredient_slug = ingredient_slug
+        self.name = name
+        self.aliases = aliases
+        self.functions = functions
+        self.our_take = our_take
+        self.first_seen_iso = first_seen_iso
+        self.last_seen_iso = last_seen_iso
+        self.source_urls = source_urls
+        self.extra = extra or {}
+
+    @classmethod
+    def new(cls, slug: str, name: str | None, now_iso: str) -> IngredientRecord:
+        return cls(
+            ingredient_id="ing_" + hashlib.sha1(slug.encode("utf-8")).hexdigest()[:12],
+            ingredient_slug=slug,
+            name=name,
+            aliases=[],
+            functions=set(),
+            our_take=None,
+            first_seen_iso=now_iso,
+            last_seen_iso=now_iso,
+            source_urls=OrderedDict(),
+        )
+
+    @classmethod
+    def from_dict(cls, row: dict) -> IngredientRecord:
+        known = set(cls.__slots__)
+        return cls(
+            ingredient_id=row.get("ingredient_id"),
+            ingredient_slug=row.get("ingredient_slug"),
+            name=row.get("name"),
+            aliases=list(row.get("aliases") or []),
+            functions=set(row.get("functions") or []),
+            our_take=row.get("our_take"),
+            first_seen_iso=row.get("first_seen_iso"),
+            last_seen_iso=row.get("last_seen_iso"),
+            source_urls=OrderedDict.fromkeys(u for u in row.get("source_urls") or [] if u),
+            extra={k: v for k, v in row.items() if k not in known},
+        )
+
+    def merge(self, row: dict, product_url: str, now_iso: str, cap_sources: int) -> None:
+        self.functions.update(row.get("functions") or [])
+        self.name = self.name or row.get("name")
+        self.our_take = best_rating(self.our_take, row.get("our_take"))
+        self.first_seen_iso = min(self.first_seen_iso or now_iso, now_iso)
+        self.last_seen_iso = max(self.last_seen_iso or now_iso, now_iso)
+        if product_url:
+            self.source_urls[product_url] = None
+            self.source_urls.move_to_end(product_url, last=False)
+        while len(self.source_urls) > cap_sources:
+            self.source_urls.popitem(last=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "ingredient_id": self.ingredient_id,
+            "ingredient_slug": self.ingredient_slug,
+            "name": self.name,
+            "aliases": self.aliases,
+            "functions": sorted(self.functions),
+            "our_take": self.our_take,
+            "first_seen_iso": self.first_seen_iso,
+            "last_seen_iso": self.last_seen_iso,
+            "source_urls": list(self.source_urls),
+            **self.extra,
+        }
+
+
+def load_index(path: str) -> dict[str, IngredientRecord]:
     if not path or not os.path.exists(path):
         return {}
-    out: dict[str, dict] = {}
+    out: dict[str, IngredientRecord] = {}
     with open(path, encoding="utf-8") as fh:
         for line in fh:
             line = line.strip()
@@ -671,7 +843,7 @@ def load_index(path: str) -> dict[str, dict]:
                 continue
             slug = row.get("ingredient_slug")
             if slug:
-                out[slug] = row
+                out[slug] = IngredientRecord.from_dict(row)
     return out
 
 
@@ -683,47 +855,83 @@ def best_rating(a: str | None, b: str | None) -> str | None:
 
 
 def upsert_index(
-    index: dict[str, dict], rows: list[dict], product_url: str, now_iso: str, cap_sources: int = 10
-) -> dict[str, dict]:
+    index: dict[str, IngredientRecord], rows: list[dict], product_url: str, now_iso: str, cap_sources: int = 10
+) -> dict[str, IngredientRecord]:
     for r in rows:
         slug = r.get("ingredient_slug")
         if not slug:
             continue
-        cur = index.get(slug) or {
-            "ingredient_id": "ing_" + hashlib.sha1(slug.encode("utf-8")).hexdigest()[:12],
-            "ingredient_slug": slug,
-            "name": r.get("name"),
-            "aliases": [],
-            "functions": [],
-            "our_take": None,
-            "first_seen_iso": now_iso,
-            "last_seen_iso": now_iso,
-            "source_urls": [],
-        }
-        fset = set(cur.get("functions") or []) | set(r.get("functions") or [])
-        cur["functions"] = sorted(fset)
-        cur["name"] = cur.get("name") or r.get("name")
-        cur["our_take"] = best_rating(cur.get("our_take"), r.get("our_take"))
-        cur["first_seen_iso"] = min(cur.get("first_seen_iso", now_iso), now_iso)
-        cur["last_seen_iso"] = max(cur.get("last_seen_iso", now_iso), now_iso)
-        srcs = [u for u in [product_url] + (cur.get("source_urls") or []) if u]
-        dedup: list[str] = []
-        for u in srcs:
-            if u not in dedup:
-                dedup.append(u)
-        cur["source_urls"] = dedup[:cap_sources]
-        index[slug] = cur
+        cur = index.get(slug)
+        if cur is None:
+            cur = index[slug] = IngredientRecord.new(slug, r.get("name"), now_iso)
+        cur.merge(r, product_url, now_iso, cap_sources)
     return index
 
 
-def write_index(path: str, index: dict[str, dict]) -> None:
+def write_index(path: str, index: dict[str, IngredientRecord]) -> None:
     os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
     with open(path, "w", encoding="utf-8") as fh:
         for slug in sorted(index.keys()):
-            row = index[slug]
+            row = index[slug].to_dict()
             fh.write(json.dumps(row, ensure_ascii=False) + "\n")
 
 
+class IngredientIndexStore:
+    """
+    SQLite-backed ingredient index for long crawls.
+
+    Each upsert reads and rewrites only the slugs a product touches (same merge rules as
+    upsert_index), so the cost per product is O(rows touched) instead of O(index size).
+    Rows are stored as their JSONL serialization; export_jsonl() writes the same sorted
+    file as write_index.
+    """
+
+    _SQLITE_MAX_VARS = 900
+
+    def __init__(self, path: str, seed_jsonl: str | None = None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS ingredient_index (slug TEXT PRIMARY KEY, row TEXT NOT NULL)")
+        empty = self.conn.execute("SELECT 1 FROM ingredient_index LIMIT 1").fetchone() is None
+        if empty and seed_jsonl:
+            self._write(load_index(seed_jsonl))
+
+    def _read(self, slugs: list[str]) -> dict[str, IngredientRecord]:
+        out: dict[str, IngredientRecord] = {}
+        for i in range(0, len(slugs), self._SQLITE_MAX_VARS):
+            chunk = slugs[i : i + self._SQLITE_MAX_VARS]
+            marks = ",".join("?" * len(chunk))
+            for slug, row in self.conn.execute(
+                f"SELECT slug, row FROM ingredient_index WHERE slug IN ({marks})", chunk
+            ):
+                out[slug] = IngredientRecord.from_dict(json.loads(row))
+        return out
+
+    def _write(self, index: dict[str, IngredientRecord]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO ingredient_index (slug, row) VALUES (?, ?) "
+                "ON CONFLICT(slug) DO UPDATE SET row = excluded.row",
+                [(slug, json.dumps(rec.to_dict(), ensure_ascii=False)) for slug, rec in index.items()],
+            )
+
+    def upsert(self, rows: list[dict], product_url: str, now_iso: str, cap_sources: int = 10) -> None:
+        slugs = list(dict.fromkeys(r["ingredient_slug"] for r in rows if r.get("ingredient_slug")))
+        if not slugs:
+            return
+        touched = upsert_index(self._read(slugs), rows, product_url, now_iso, cap_sources=cap_sources)
+        self._write(touched)
+
+    def export_jsonl(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fh:
+            for (row,) in self.conn.execute("SELECT row FROM ingredient_index ORDER BY slug"):
+                fh.write(row + "\n")
+
+    def close(self) -> None:
+        self.conn.close()
+
+
 # -------------------------
 # IO / CLI
 # -------------------------
@@ -735,12 +943,154 @@ def append_jsonl(path: str, record: dict) -> None:
         f.write(json.dumps(record, ensure_ascii=False) + "\n")
 
 
+# -------------------------
+# Batch mode (--urls-file)
+# -------------------------
+
+
+async def fetch_html_async(client: AsyncHttpClient, url: str, cache: HttpCache | None = None) -> str:
+    cached = None
+    if cache:
+        cached = await asyncio.to_thread(cache.lookup, url)
+        if cached and cache.is_fresh(cached):
+            return cached.body
+        if cache.offline:
+            raise CacheMiss(url)
+    resp = await client.get(url, headers=HttpCache.conditional_headers(cached))
+    if resp.status_code == 304 and cached:
+        return (await asyncio.to_thread(cache.revalidated, cached, resp.headers)).body
+    resp.raise_for_status()
+    if cache:
+        await asyncio.to_thread(cache.store, url, resp.text, resp.headers)
+    return resp.text
+
+
+async def load_robots_async(
+    client: AsyncHttpClient, url: str, robots_cache: RobotsCache
+) -> robotparser.RobotFileParser | None:
+    robots_url = RobotsCache.robots_url(url)
+    rp = await asyncio.to_thread(robots_cache.get, robots_url)
+    if rp is not None:
+        return rp
+    try:
+        resp = await client.get(robots_url)
+    except httpx.HTTPError:
+        return None
+    return await asyncio.to_thread(robots_cache.put, robots_url, resp.status_code, resp.text)
+
+
+def open_index_store(args: argparse.Namespace) -> IngredientIndexStore | None:
+    if not args.ingredient_index_db:
+        return None
+    return IngredientIndexStore(args.ingredient_index_db, seed_jsonl=args.emit_ingredient_index)
+
+
+async def run_batch(
+    urls: list[str],
+    args: argparse.Namespace,
+    *,
+    cache: HttpCache | None,
+    robots_cache: RobotsCache,
+    map_json: dict | None,
+    join: list[str],
+) -> int:
+    rate = args.rate if args.rate is not None else (1.0 / args.sleep if args.sleep > 0 else 0.0)
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+    robots: dict[str, asyncio.Future] = {}
+    store = open_index_store(args)
+    index = load_index(args.emit_ingredient_index) if args.emit_ingredient_index and store is None else None
+
+    # Pacing, per-host caps, keep-alive and 429/5xx retries all live in the shared client
+    async with AsyncHttpClient(
+        headers={"User-Agent": args.ua},
+        timeout=args.timeout,
+        max_connections=args.concurrency,
+        per_host=args.concurrency,
+        rate_per_host=rate,
+    ) as client:
+
+        async def allowed(url: str) -> bool:
+            host = urllib.parse.urlparse(url).netloc
+            if host not in robots:
+                robots[host] = asyncio.ensure_future(load_robots_async(client, url, robots_cache))
+            rp = await robots[host]
+            # Be conservative: fail closed
+            return bool(rp and rp.can_fetch(args.ua, url))
+
+        async def scrape(url: str) -> tuple[str, tuple[dict, list[dict]] | None, str | None]:
+            async with semaphore:
+                try:
+                    if not args.from_cache and not args.ignore_robots and not await allowed(url):
+                        return url, None, "blocked by robots.txt"
+                    html = await fetch_html_async(client, url, cache)
+                    parsed = await asyncio.to_thread(
+                        parse_product_page,
+                        html,
+                        url,
+                        parser=args.parser,
+                        map_json=map_json,
+                        join_sources=join,
+                        include_details_html=args.include_details_html,
+                        product_id_from=args.product_id_from,
+                    )
+                    return url, parsed, None
+                except CacheMiss:
+                    return url, None, "not in page cache"
+                except Exception as e:
+                    return url, None, (str(e).splitlines() or [type(e).__name__])[0]
+
+        # Single writer: every record is written here, in completion order
+        out = None
+        if args.out_jsonl:
+            os.makedirs(os.path.dirname(os.path.abspath(args.out_jsonl)), exist_ok=True)
+            out = open(args.out_jsonl, "a", encoding="utf-8")
+        ok = 0
+        failed = 0
+        try:
+            for fut in asyncio.as_completed([scrape(u) for u in urls]):
+                url, parsed, error = await fut
+                if parsed is None:
+                    failed += 1
+                    sys.stderr.write(f"Failed {url}: {error}\n")
+                    continue
+                rec, skim_rows = parsed
+                line = json.dumps(rec, ensure_ascii=False) + "\n"
+                if out:
+                    out.write(line)
+                    out.flush()
+                else:
+                    sys.stdout.write(line)
+                now_iso = time.strftime("%Y-%m-%dT%H:%M:%S")
+                if store is not None:
+                    store.upsert(skim_rows, rec["links"]["product_url"], now_iso, cap_sources=10)
+                elif index is not None:
+                    upsert_index(index, skim_rows, rec["links"]["product_url"], now_iso, cap_sources=10)
+                ok += 1
+        finally:
+            if out:
+                out.close()
+            if store is not None:
+                if args.emit_ingredient_index:
+                    store.export_jsonl(args.emit_ingredient_index)
+                store.close()
+            elif index is not None:
+                write_index(args.emit_ingredient_index, index)
+
+    sys.stderr.write(f"Batch complete: {ok} scraped, {failed} failed (of {len(urls)}).\n")
+    return 0 if failed == 0 else 1
+
+
 def main():
     ap = argparse.ArgumentParser(
         description="Scrape an INCIDecoder product page into a JSONL row (provenance ingredients; image assets; optional ingredient index)"
     )
-    ap.add_argument("url", help="INCIDecoder product URL")
+    ap.add_argument("url", nargs="?", help="INCIDecoder product URL (omit with --urls-file)")
     ap.add_argument("out_jsonl", nargs="?", help="Output JSONL file path (appends). If omitted, prints JSON to stdout")
+    ap.add_argument("--urls-file", type=str, help="Batch mode: text file with one product URL per line")
+    ap.add_argument("--concurrency", type=int, default=4, help="Batch mode: max in-flight products")
+    ap.add_argument(
+        "--rate", type=float, help="Batch mode: requests per second per host (default 1/--sleep; 0 = unlimited)"
+    )
     ap.add_argument("--sleep", type=float, default=2.0, help="Seconds to sleep after request (politeness)")
     ap.add_argument("--timeout", type=float, default=20.0, help="HTTP timeout seconds")
     ap.add_argument("--ua", type=str, default=UA, help="User-Agent string")
@@ -749,6 +1099,25 @@ def main():
         "--map-json", type=str, help='Path to JSON mapping (either {inci: family} or {"inci_to_family": {...}})'
     )
     ap.add_argument("--ignore-robots", action="store_true", help="Skip robots.txt check (use only if permitted)")
+    ap.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR, help="Directory for the on-disk page cache")
+    ap.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=DEFAULT_CACHE_TTL_HOURS,
+        help="Hours a cached page is served without revalidation (ETag / Last-Modified)",
+    )
+    ap.add_argument(
+        "--robots-cache-dir", type=str, default=DEFAULT_ROBOTS_CACHE_DIR, help="Directory for cached robots.txt files"
+    )
+    ap.add_argument(
+        "--robots-ttl", type=float, default=DEFAULT_ROBOTS_TTL_HOURS, help="Hours to trust cached robots.txt"
+    )
+    ap.add_argument("--no-cache", action="store_true", help="Disable the on-disk page and robots.txt caches")
+    ap.add_argument(
+        "--from-cache",
+        action="store_true",
+        help="Offline mode: parse the cached page only (no robots.txt or page requests)",
+    )
 
     ap.add_argument(
         "--join-ingredients-sources",
@@ -758,6 +1127,13 @@ def main():
     )
     ap.add_argument("--include-details-html", action="store_true", help="Also store metadata.details_blurb_html")
     ap.add_argument("--emit-ingredient-index", type=str, help="Path to ingredient index JSONL (upsert). Off if omitted")
+    ap.add_argument(
+        "--ingredient-index-db",
+        type=str,
+        help="SQLite ingredient index store (incremental upserts). With --emit-ingredient-index, --urls-file runs "
+        "export the JSONL once at the end; single-URL runs only upsert (run again with neither a URL nor "
+        "--urls-file to export)",
+    )
     ap.add_argument(
         "--product-id-from",
         choices=["url_hash", "slug"],
@@ -767,11 +1143,26 @@ def main():
 
     args = ap.parse_args()
 
-    if not args.ignore_robots and not is_allowed_by_robots(args.url, args.ua):
-        sys.stderr.write(
-            "Blocked by robots.txt or failed to fetch robots — aborting politely. Use --ignore-robots if you have permission."
-        )
+    if args.from_cache and args.no_cache:
+        sys.stderr.write("--from-cache cannot be combined with --no-cache.\n")
         sys.exit(2)
+    cache = None if args.no_cache else HttpCache(args.cache_dir, ttl_hours=args.cache_ttl, offline=args.from_cache)
+    robots_cache = RobotsCache(None if args.no_cache else args.robots_cache_dir, ttl_hours=args.robots_ttl)
+
+    if args.urls_file:
+        # In batch mode the single positional argument is the output path
+        if args.url and not args.out_jsonl:
+            args.out_jsonl, args.url = args.url, None
+        if args.url:
+            ap.error("pass either a product URL or --urls-file, not both")
+    elif not args.url:
+        if args.ingredient_index_db and args.emit_ingredient_index:
+            store = open_index_store(args)
+            store.export_jsonl(args.emit_ingredient_index)
+            store.close()
+            print(f"Exported ingredient index → {args.emit_ingredient_index}")
+            return
+        ap.error("a product URL or --urls-file is required")
 
     map_json = None
     if args.map_json:
@@ -781,9 +1172,35 @@ def main():
         except Exception as e:
             sys.stderr.write(f"Warning: failed to load --map-json: {e}")
 
-    html = fetch_html(args.url, timeout=args.timeout, user_agent=args.ua)
-
     join = [s.strip().lower() for s in (args.join_ingredients_sources or "").split(",") if s.strip()]
+
+    if args.urls_file:
+        with open(args.urls_file, encoding="utf-8") as fh:
+            urls = list(dict.fromkeys(line.strip() for line in fh if line.strip()))
+        sys.exit(
+            asyncio.run(run_batch(urls, args, cache=cache, robots_cache=robots_cache, map_json=map_json, join=join))
+        )
+
+    # One pooled client for robots.txt and the page, so both share a keep-alive connection
+    client = HttpClient(headers={"User-Agent": args.ua}, timeout=args.timeout)
+    if (
+        not args.from_cache
+        and not args.ignore_robots
+        and not is_allowed_by_robots(args.url, args.ua, robots_cache, timeout=args.timeout, client=client)
+    ):
+        sys.stderr.write(
+            "Blocked by robots.txt or failed to fetch robots — aborting politely. Use --ignore-robots if you have permission."
+        )
+        sys.exit(2)
+
+    try:
+        html = fetch_html(args.url, timeout=args.timeout, user_agent=args.ua, cache=cache, client=client)
+    except CacheMiss:
+        sys.stderr.write(f"Not in page cache (--from-cache): {args.url}\n")
+        sys.exit(1)
+    finally:
+        client.close()
+
     now_iso = time.strftime("%Y-%m-%dT%H:%M:%S")
 
     rec, skim_rows = parse_product_page(
@@ -802,13 +1219,24 @@ def main():
     else:
         sys.stdout.write(json.dumps(rec, ensure_ascii=False) + "\n")
 
-    if args.emit_ingredient_index:
+    if args.ingredient_index_db:
+        store = open_index_store(args)
+        store.upsert(skim_rows, rec["links"]["product_url"], now_iso, cap_sources=10)
+        store.close()
+        # Exporting rewrites the whole index, so per-product runs leave it to the export-only mode
+        if args.emit_ingredient_index:
+            sys.stderr.write(
+                f"Ingredient index updated in {args.ingredient_index_db}; export it with "
+                f"--ingredient-index-db {args.ingredient_index_db} --emit-ingredient-index {args.emit_ingredient_index}\n"
+            )
+    elif args.emit_ingredient_index:
         idx_path = args.emit_ingredient_index
         index = load_index(idx_path)
         index = upsert_index(index, skim_rows, rec["links"]["product_url"], now_iso, cap_sources=10)
         write_index(idx_path, index)
 
-    time.sleep(max(0.0, args.sleep))
+    if not args.from_cache:
+        time.sleep(max(0.0, args.sleep))
 
 
 if __name__ == "__main__":
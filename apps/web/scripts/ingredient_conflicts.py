@@ -0,0 +1,213 @@
+"""
+ingredient_conflicts.py
+
+Precomputed ingredient interaction index for recommendation validation.
+
+Every ingredient in ingredients_1 is mapped to functional families (from its skinsort
+tags and what_it_does functions, normalised with the incidecoder family slugs), and a
+small table of known family conflicts (retinoid + AHA, vitamin C + benzoyl peroxide, ...)
+is expanded into a family -> partner lookup. Checking a routine is then one pass over its
+products instead of the reviewer re-deriving interactions from JSON on every run.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Literal
+
+from ingredient_families import canonicalize_family, slugify
+from skin_lib import Routine
+
+Severity = Literal["avoid", "caution"]
+
+# Skinsort tags, what_it_does functions and product active_ingredients labels that name
+# the same family differently (keys are already slugified)
+FAMILY_ALIASES = {
+    "retinoids": "retinoid",
+    "exfoliator": "exfoliant",
+    "exfoliators": "exfoliant",
+    "exfoliating": "exfoliant",
+    "ahas": "aha",
+    "bhas": "bha",
+    "phas": "pha",
+    "ascorbic_acid": "vitamin_c",
+    "bpo": "benzoyl_peroxide",
+}
+
+ACID_FAMILIES = ("aha", "bha", "pha")
+
+# Skinsort also tags physical abrasives (silica, kaolin, ...) "Exfoliant", so that family is only
+# taken from product-level active_ingredients labels, never from single ingredients
+LABEL_ONLY_FAMILIES = {"exfoliant"}
+# Acids listed as pH adjusters (citric, tartaric, ...) are trace amounts, not actives
+PH_ADJUSTER_FUNCTION = "buffering"
+
+
+@dataclass(frozen=True)
+class ConflictRule:
+    families: tuple[str, str]
+    severity: Severity
+    reason: str
+
+
+CONFLICT_RULES = [
+    *(
+        ConflictRule(
+            ("retinoid", acid),
+            "avoid",
+            "Retinoids and exfoliating acids in the same session compound irritation and barrier damage; "
+            "alternate nights or split them between AM and PM.",
+        )
+        for acid in (*ACID_FAMILIES, "exfoliant")
+    ),
+    ConflictRule(
+        ("retinoid", "benzoyl_peroxide"),
+        "avoid",
+        "Benzoyl peroxide oxidises and deactivates retinoids; use them in different sessions.",
+    ),
+    ConflictRule(
+        ("vitamin_c", "benzoyl_peroxide"),
+        "avoid",
+        "Benzoyl peroxide oxidises vitamin C; keep vitamin C in the AM and benzoyl peroxide in the PM.",
+    ),
+    ConflictRule(
+        ("retinoid", "vitamin_c"),
+        "caution",
+        "Vitamin C and retinoids are usually split between AM (vitamin C) and PM (retinoid) for tolerance.",
+    ),
+    *(
+        ConflictRule(
+            ("vitamin_c", acid),
+            "caution",
+            "Layering vitamin C with exfoliating acids increases the risk of stinging on sensitive skin.",
+        )
+        for acid in ACID_FAMILIES
+    ),
+    *(
+        ConflictRule(
+            ("benzoyl_peroxide", acid),
+            "caution",
+            "Benzoyl peroxide with exfoliating acids is very drying; check the user's tolerance.",
+        )
+        for acid in ACID_FAMILIES
+    ),
+    ConflictRule(
+        ("aha", "bha"),
+        "caution",
+        "Two separate acid exfoliants in one session risk over-exfoliation.",
+    ),
+]
+
+
+def family_key(label: str) -> str:
+    """Canonical family slug for a tag, function or active-ingredient label ('Retinoids' -> 'retinoid')."""
+    slug = canonicalize_family(slugify(label))
+    return FAMILY_ALIASES.get(slug, slug)
+
+
+def families_of(labels: list[str]) -> set[str]:
+    return {family_key(label) for label in labels if label}
+
+
+@dataclass(frozen=True)
+class ConflictHit:
+    session: str
+    products: tuple[str, str]
+    families: tuple[str, str]
+    severity: Severity
+    reason: str
+
+    def describe(self) -> str:
+        first, second = self.products
+        return (
+            f"{self.session} routine layers '{first}' ({self.families[0]}) with '{second}' ({self.families[1]}): "
+            f"{self.reason}"
+        )
+
+
+@dataclass
+class ConflictIndex:
+    """Families per ingredient_slug plus the family -> conflicting family lookup."""
+
+    families_by_slug: dict[str, frozenset[str]] = field(default_factory=dict)
+    rules: dict[str, dict[str, ConflictRule]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        if not self.rules:
+            for rule in CONFLICT_RULES:
+                a, b = rule.families
+                self.rules.setdefault(a, {})[b] = rule
+                self.rules.setdefault(b, {})[a] = rule
+
+    @classmethod
+    def from_ingredient_rows(cls, rows: list[dict[str, Any]]) -> "ConflictIndex":
+        """Builds the index from ingredients_1 rows (ingredient_slug or url, tags, what_it_does)."""
+        tracked = {family for rule in CONFLICT_RULES for family in rule.families}
+        families_by_slug: dict[str, frozenset[str]] = {}
+        for row in rows:
+            slug = row.get("ingredient_slug") or (row.get("url") or "").rstrip("/").rsplit("/", 1)[-1]
+            if not slug:
+                continue
+            tags = [t.get("name", "") for t in row.get("tags") or [] if isinstance(t, dict)]
+            functions = [f.get("function", "") for f in row.get("what_it_does") or [] if isinstance(f, dict)]
+            roles = families_of(functions)
+            families = (families_of(tags) | roles) & tracked - LABEL_ONLY_FAMILIES
+            if PH_ADJUSTER_FUNCTION in roles and "exfoliant" not in roles:
+                families -= set(ACID_FAMILIES)
+            if families:
+                families_by_slug[slug] = frozenset(families)
+        return cls(families_by_slug=families_by_slug)
+
+    def product_families(self, product: dict[str, Any]) -> set[str]:
+        """Families of a retrieved product from its active_ingredients labels and ingredient_slugs."""
+        families: set[str] = set()
+        actives = product.get("active_ingredients")
+        if isinstance(actives, list):
+            families.update(family_key(a) for a in actives if isinstance(a, str))
+        slugs = product.get("ingredient_slugs")
+        if isinstance(slugs, list):
+            for slug in slugs:
+                families |= self.families_by_slug.get(slug, frozenset())
+        return families & self.rules.keys()
+
+    def check_routine(self, routine: Routine, products_by_slug: dict[str, dict[str, Any]]) -> list[ConflictHit]:
+        """
+        Conflicts between primary products used in the same session. One pass per session:
+        each product's families are looked up against the families already seen in it.
+        """
+        sessions = [("AM", routine.am), ("PM", routine.pm)]
+        if routine.weekly:
+            sessions.append(("Weekly", routine.weekly))
+
+        hits: dict[tuple[str, str, str], ConflictHit] = {}
+        for session, steps in sessions:
+            seen: dict[str, str] = {}  # family -> first product_slug providing it
+            for step in steps:
+                for rec in step.products:
+                    # Alternatives replace the primary pick, so only primaries are layered
+                    product = products_by_slug.get(rec.product_slug)
+                    if rec.selection_type != "primary" or product is None:
+                        continue
+                    families = self.product_families(product)
+                    for family in families:
+                        for partner, rule in self.rules[family].items():
+                            other = seen.get(partner)
+                            # A single product formulated with both is the brand's call
+                            if other is None or other == rec.product_slug:
+                                continue
+                            key = (session, other, rec.product_slug)
+                            current = hits.get(key)
+                            if current is None or (current.severity == "caution" and rule.severity == "avoid"):
+                                hits[key] = ConflictHit(
+                                    session, (other, rec.product_slug), (partner, family), rule.severity, rule.reason
+                                )
+                    for family in families:
+                        seen.setdefault(family, rec.product_slug)
+        return list(hits.values())
+
+
+def format_conflicts_for_prompt(hits: list[ConflictHit]) -> str:
+    """Markdown block for the reviewer: the precomputed findings plus the rule table they came from."""
+    lines = ["**Precomputed ingredient conflicts for this routine:**"]
+    lines += [f"- [{hit.severity}] {hit.describe()}" for hit in hits] or ["- None found."]
+    lines += ["", "**Known conflict rules (families, severity):**"]
+    lines += [f"- {a} + {b} ({rule.severity}): {rule.reason}" for rule in CONFLICT_RULES for a, b in [rule.families]]
+    return "\n".join(lines)
@@ -0,0 +1,30 @@
+"""
+ingredient_families.py
+
+Label slugs and functional-family canonicalisation shared by the incidecoder scraper and
+the ingredient conflict index. Kept dependency-free so the recommendation pipeline can
+import it without pulling in the scraper's HTTP/HTML stack.
+"""
+
+import re
+
+# Map long, UI-ish function labels to canonical family slugs
+_CANON_FAMILY = {
+    "skin_identical_ingredient": "skin_identical",
+    "moisturizer_humectant": "humectant",
+    "surfactant_cleansing": "surfactant",
+}
+
+_slug_rx = re.compile("[^a-z0-9]+")
+
+
+def canonicalize_family(slug: str) -> str:
+    return _CANON_FAMILY.get(slug, slug)
+
+
+def slugify(label: str) -> str:
+    s = (label or "").strip().lower()
+    s = s.replace("&", " and ")
+    s = _slug_rx.sub("_", s)
+    s = s.strip("_")
+    return s or "unknown"
@@ -0,0 +1,119 @@
+"""
+ingredient_grounding.py
+
+Synonym-aware grounding of retrieved products against the philosophy's key ingredients.
+
+An alias index built from ingredients_1 (name, slug, CosIng INCI/INN names, "also known as"
+mentions in the description and ingredient-class tags such as "Vitamin C") resolves each key
+ingredient to a set of ingredient slugs. Products become a sparse product x ingredient
+matrix over their ingredient_slugs (plus their active_ingredients labels), so grounding all
+candidates is one sparse matrix product instead of per-product set intersections.
+"""
+
+import re
+from typing import Any
+
+import numpy as np
+from recommendation_rules import normalize_term
+from scipy import sparse
+
+# Tags that describe effects rather than what an ingredient is
+EFFECT_TAG_PREFIXES = ("helps with", "good for", "can worsen", "may ", "reduces", "bad for", "eu allergen")
+ALIAS_PATTERNS = [
+    re.compile(r"also known as ([^,.;)]+)", re.IGNORECASE),
+    re.compile(r"know this ingredient as ([^,.;)]+)", re.IGNORECASE),
+    re.compile(r"\bform of (vitamin [a-z0-9]+)", re.IGNORECASE),
+]
+_bracket_rx = re.compile(r"\[[^\]]*\]")
+_term_split_rx = re.compile(r"[()/]|\bor\b")
+
+LABEL_PREFIX = "label:"
+
+
+def ingredient_aliases(row: dict[str, Any]) -> tuple[set[str], set[str]]:
+    """(names, class tags) an ingredients_1 row is known by, normalized."""
+    slug = row.get("ingredient_slug") or (row.get("url") or "").rstrip("/").rsplit("/", 1)[-1]
+    names = [slug, row.get("name") or ""]
+    cosing = row.get("cosing_data") or {}
+    if isinstance(cosing, dict):
+        names += [cosing.get("INCI Name") or "", _bracket_rx.sub("", cosing.get("INN Name") or "")]
+    description = row.get("description") or ""
+    for pattern in ALIAS_PATTERNS:
+        names += [m.group(1) for m in pattern.finditer(description)]
+    tags = [tag.get("name", "") for tag in row.get("tags") or [] if isinstance(tag, dict)]
+    classes = [tag for tag in tags if tag and not tag.lower().startswith(EFFECT_TAG_PREFIXES)]
+    return {normalize_term(n) for n in names if n.strip()} - {""}, {normalize_term(c) for c in classes} - {""}
+
+
+class IngredientAliasIndex:
+    """Normalized alias -> ingredient slugs known by it."""
+
+    def __init__(self, aliases: dict[str, set[str]] | None = None):
+        self.aliases = aliases or {}
+
+    @classmethod
+    def from_ingredient_rows(cls, rows: list[dict[str, Any]]) -> "IngredientAliasIndex":
+        by_name: dict[str, set[str]] = {}
+        by_class: dict[str, set[str]] = {}
+        for row in rows:
+            slug = row.get("ingredient_slug") or (row.get("url") or "").rstrip("/").rsplit("/", 1)[-1]
+            if not slug:
+                continue
+            names, classes = ingredient_aliases(row)
+            for alias in names:
+                by_name.setdefault(alias, set()).add(slug)
+            for alias in classes:
+                by_class.setdefault(alias, set()).add(slug)
+        # A class tag wins over a literal name: "BHA" means salicylic acid & co., not butylated hydroxyanisole
+        return cls({**by_name, **by_class})
+
+    def term_keys(self, term: str) -> set[str]:
+        """Matrix columns a key ingredient matches: its slugs plus the matching active-ingredient labels."""
+        parts = [term, *_term_split_rx.split(term)]  # "Salicylic Acid (BHA)" -> itself, "Salicylic Acid", "BHA"
+        keys: set[str] = set()
+        for part in parts:
+            alias = normalize_term(part)
+            if alias:
+                keys.add(LABEL_PREFIX + alias)
+                keys |= self.aliases.get(alias, set())
+        return keys
+
+
+def product_keys(product: dict[str, Any]) -> list[str]:
+    keys = [s for s in product.get("ingredient_slugs") or [] if isinstance(s, str)]
+    keys += [LABEL_PREFIX + normalize_term(a) for a in product.get("active_ingredients") or [] if isinstance(a, str)]
+    return keys
+
+
+def ground_products(
+    products: list[dict[str, Any]], key_ingredients: list[str], alias_index: IngredientAliasIndex
+) -> None:
+    """Sets `matched_key_ingredients` on every product (the key ingredient terms it contains)."""
+    if not products:
+        return
+    terms = [t for t in dict.fromkeys(key_ingredients) if t.strip()]
+    vocab: dict[str, int] = {}
+    rows, cols = [], []
+    for i, product in enumerate(products):
+        for key in set(product_keys(product)):
+            rows.append(i)
+            cols.append(vocab.setdefault(key, len(vocab)))
+    incidence = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(len(products), max(1, len(vocab)))
+    )
+
+    t_rows, t_cols = [], []
+    for j, term in enumerate(terms):
+        for key in alias_index.term_keys(term):
+            if key in vocab:
+                t_rows.append(vocab[key])
+                t_cols.append(j)
+    term_matrix = sparse.csr_matrix(
+        (np.ones(len(t_rows), dtype=np.int32), (t_rows, t_cols)), shape=(incidence.shape[1], max(1, len(terms)))
+    )
+
+    hits = (incidence @ term_matrix).tocsr()
+    hits.sort_indices()
+    for i, product in enumerate(products):
+        matched = hits.indices[hits.indptr[i] : hits.indptr[i + 1]]
+        product["matched_key_ingredients"] = [terms[j] for j in matched if j < len(terms)]
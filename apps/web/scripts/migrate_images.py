@@ -6,13 +6,25 @@
 #     "tqdm",
 # ]
 # ///
+"""
+migrate_images.py
 
-import asyncio
-import mimetypes
+Migrates product images from public/products to the Supabase Storage bucket and points
+products_1.image_url at the public URLs.
+
+The bucket is listed first and only files that are missing or differ in size are
+uploaded; uploads and row updates run on a bounded thread pool. Every finished file is
+appended to a progress log, so an interrupted run resumes where it stopped.
+"""
+
+import argparse
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 from dotenv import load_dotenv
+from storage_lib import PRODUCT_IMAGES_BUCKET, list_bucket_objects, upload_product_image
 from supabase import Client, create_client
 from tqdm import tqdm
 
@@ -29,11 +41,13 @@ if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
 # Initialize Supabase Client
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
-BUCKET_NAME = "product-images"
+BUCKET_NAME = PRODUCT_IMAGES_BUCKET
 PRODUCTS_DIR = Path("public/products")
+PROGRESS_FILE = Path(".cache/migrate_images_progress.jsonl")
+DEFAULT_WORKERS = 8
 
 
-async def create_bucket_if_not_exists():
+def create_bucket_if_not_exists():
     """Creates the storage bucket if it doesn't exist."""
 
     try:
@@ -52,77 +66,96 @@ async def create_bucket_if_not_exists():
         # Continue anyway, as it might exist but we lack list permissions (unlikely with service role)
 
 
-async def migrate_images():
+def load_progress(path: Path) -> dict[str, int]:
+    """Returns {file name: size} for every file a previous run fully migrated."""
+    done: dict[str, int] = {}
+    if not path.exists():
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # a torn last line from an interrupted run
+            done[entry["name"]] = entry["size"]
+    return done
+
+
+def migrate_file(file_path: Path, needs_upload: bool) -> str:
+    """Uploads one file (if needed) and updates its products_1 row; returns the public URL."""
+    if needs_upload:
+        public_url = upload_product_image(supabase, str(file_path), BUCKET_NAME)
+    else:
+        public_url = supabase.storage.from_(BUCKET_NAME).get_public_url(file_path.name)
+
+    # Filenames are `<product_slug>.<ext>` (see skinsort_to_jsonl.generate_filename_from_url)
+    slug = file_path.stem
+    supabase.table("products_1").update({"image_url": public_url}).eq("product_slug", slug).execute()
+    return public_url
+
+
+def migrate_images(workers: int = DEFAULT_WORKERS, progress_file: Path = PROGRESS_FILE, dry_run: bool = False):
     """Migrates images from public/products to Supabase Storage."""
 
-    await create_bucket_if_not_exists()
+    create_bucket_if_not_exists()
 
     if not PRODUCTS_DIR.exists():
         print(f"Directory {PRODUCTS_DIR} does not exist.")
         return
 
     files = [f for f in PRODUCTS_DIR.iterdir() if f.is_file() and not f.name.startswith(".")]
-    print(f"Found {len(files)} files to migrate.")
+    local = {f.name: f.stat().st_size for f in files}
+    print(f"Found {len(files)} local files.")
+
+    remote = list_bucket_objects(supabase, BUCKET_NAME)
+    done = load_progress(progress_file)
+
+    # Diff: skip files already migrated at this size; upload only missing/changed objects
+    pending = [f for f in files if done.get(f.name) != local[f.name]]
+    uploads = {f.name for f in pending if remote.get(f.name) != local[f.name]}
+    print(
+        f"{len(remote)} objects in '{BUCKET_NAME}', {len(files) - len(pending)} already migrated; "
+        f"{len(uploads)} to upload, {len(pending) - len(uploads)} to relink only."
+    )
+    if dry_run or not pending:
+        return
 
     success_count = 0
     error_count = 0
 
-    for file_path in tqdm(files, desc="Migrating images"):
-        try:
-            file_name = file_path.name
-
-            # Determine content type
-            content_type, _ = mimetypes.guess_type(file_path)
-            if not content_type:
-                content_type = "application/octet-stream"
-
-            # 1. Upload to Storage
-            with open(file_path, "rb") as f:
-                try:
-                    supabase.storage.from_(BUCKET_NAME).upload(
-                        path=file_name,
-                        file=f,
-                        file_options={"content-type": content_type, "upsert": "true"},  # Upsert to handle re-runs
-                    )
-                except Exception as upload_error:
-                    # Check if error is "The resource already exists" (upsert sometimes fails or different behaviors)
-                    # With upsert=True it should overwrite.
-                    print(f"\nUpload warning for {file_name}: {upload_error}")
-
-            # 2. Get Public URL
-            public_url = supabase.storage.from_(BUCKET_NAME).get_public_url(file_name)
-
-            # 3. Update Database (products_1 table)
-            # Assuming filename corresponds to something we can match, OR we just update based on the image_url convention?
-            # Wait, the current `products_1` probably has `image_url` pointing to `/products/foo.jpg`.
-            # We want to replace `/products/foo.jpg` with `https://.../product-images/foo.jpg`.
-
-            # The strategy: Update records where `image_url` ends with this filename?
-            # Or better, we know the file structure: `public/products/slug.jpg`.
-            # Does `products_1` have a `product_slug`? Yes.
-            # Does the filename match the slug? Let's assume filename = slug.jpg or similar.
-            # Actually, looking at the file list, it's `brand-product-name.jpg`.
-            # The `product_slug` is likely `brand-product-name`.
-
-            # Let's try to match by product_slug if filename matches `slug.ext`.
-            slug = file_path.stem  # remove extension
-
-            # Update query
-            supabase.table("products_1").update({"image_url": public_url}).eq("product_slug", slug).execute()
-
-            # Also try to match by existing image_url if strictly relying on slug is risky (though slug is PK)
-            # The file list `abib-heartleaf...` looks exactly like slugs.
-
+    progress_file.parent.mkdir(parents=True, exist_ok=True)
+    with (
+        open(progress_file, "a", encoding="utf-8") as log,
+        ThreadPoolExecutor(max_workers=max(1, workers)) as pool,
+    ):
+        futures = {pool.submit(migrate_file, f, f.name in uploads): f for f in pending}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Migrating images"):
+            file_path = futures[future]
+            try:
+                public_url = future.result()
+            except Exception as e:
+                print(f"\nError processing {file_path.name}: {e}")
+                error_count += 1
+                continue
+            log.write(json.dumps({"name": file_path.name, "size": local[file_path.name], "url": public_url}) + "\n")
+            log.flush()
             success_count += 1
 
-        except Exception as e:
-            print(f"\nError processing {file_path.name}: {e}")
-            error_count += 1
-
     print("\nMigration Complete.")
     print(f"Success: {success_count}")
     print(f"Errors: {error_count}")
 
 
 if __name__ == "__main__":
-    asyncio.run(migrate_images())
+    parser = argparse.ArgumentParser(description="Migrate product images to Supabase Storage.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent uploads / row updates.")
+    parser.add_argument(
+        "--progress-file", type=Path, default=PROGRESS_FILE, help="Append-only log of migrated files (resume state)."
+    )
+    parser.add_argument("--restart", action="store_true", help="Ignore the progress log and re-check every file.")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the diff against the bucket.")
+    args = parser.parse_args()
+
+    if args.restart and args.progress_file.exists():
+        args.progress_file.unlink()
+    migrate_images(workers=args.workers, progress_file=args.progress_file, dry_run=args.dry_run)
@@ -2,7 +2,7 @@
 # /// script
 # requires-python = ">=3.10"
 # dependencies = [
-#     "requests",
+#     "httpx[http2]",
 #     "beautifulsoup4",
 #     "tqdm",
 #     "supabase",
@@ -15,19 +15,30 @@
 populate_ingredients.py
 
 A script to scrape ingredient details from incidecoder.com and populate the Supabase database.
+
+Pages are fetched by a small thread pool sharing one pooled, retrying scrape_lib.HttpClient,
+paced by a per-host token bucket (--rate requests/second), and upserted to `ingredients` in batches on
+the `name` conflict key. URLs whose row was updated within --refresh-after-hours are skipped.
 """
 
+import argparse
 import json
 import os
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
 
-import requests
+import httpx
 from bs4 import BeautifulSoup
+from scrape_lib import HttpClient
 from skin_lib import get_supabase_client, setup_logger
 from tqdm import tqdm
 
 INPUT_FILE = "data/ingredient_urls.txt"
 DELAY = 1
+DEFAULT_CONCURRENCY = 4
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_REFRESH_AFTER_HOURS = 24 * 7
+PAGE_SIZE = 1000
 
 
 def parse_ingredient_page(soup):
@@ -75,62 +86,175 @@ def parse_ingredient_page(soup):
     return data
 
 
+def fetch_recently_updated(supabase, since: datetime) -> set[str]:
+    """Returns the source_url of every ingredient row updated at or after `since`."""
+    fresh: set[str] = set()
+    start = 0
+    while True:
+        response = (
+            supabase.table("ingredients")
+            .select("source_url")
+            .gte("updated_at", since.isoformat())
+            .range(start, start + PAGE_SIZE - 1)
+            .execute()
+        )
+        fresh.update(row["source_url"] for row in response.data if row.get("source_url"))
+        if len(response.data) < PAGE_SIZE:
+            return fresh
+        start += PAGE_SIZE
+
+
+def scrape_ingredient(client: HttpClient, url: str) -> dict | None:
+    """Fetches and parses one ingredient page; returns the db record or None if unnamed."""
+    response = client.get(url)
+    response.raise_for_status()
+
+    soup = BeautifulSoup(response.content, "html.parser")
+    ingredient_data = parse_ingredient_page(soup)
+
+    if not ingredient_data.get("name"):
+        return None
+
+    return {
+        "name": ingredient_data["name"],
+        "what_it_does": ingredient_data["what_it_does"],
+        "our_take": ingredient_data["our_take"],
+        "quick_facts": ingredient_data["quick_facts"],
+        "image_url": ingredient_data["image_url"],
+        "description": ingredient_data["description"],
+        "cosing_info": json.dumps(ingredient_data["cosing_info"]) if ingredient_data["cosing_info"] else None,
+        "source_url": url,
+        "updated_at": "now()",
+    }
+
+
+def upsert_batch(supabase, records: list[dict], logger) -> tuple[int, list[str]]:
+    """
+    Upserts a batch on `name`; duplicate names within a batch keep the last record.
+
+    If the batch request fails, each row is retried on its own so one bad row does not drop the
+    rest. Returns the number of rows upserted and the source_url of every row that still failed.
+    """
+    if not records:
+        return 0, []
+    # Postgres rejects an ON CONFLICT batch that touches the same row twice
+    by_name = {record["name"]: record for record in records}
+    try:
+        supabase.table("ingredients").upsert(list(by_name.values()), on_conflict="name").execute()
+        return len(by_name), []
+    except Exception as e:
+        logger.warning(f"Failed to upsert batch of {len(by_name)} ingredients, retrying row by row: {e}")
+
+    upserted = 0
+    failed: list[str] = []
+    for record in by_name.values():
+        try:
+            supabase.table("ingredients").upsert(record, on_conflict="name").execute()
+            upserted += 1
+        except Exception as e:
+            logger.error(f"Failed to upsert ingredient '{record['name']}' ({record['source_url']}): {e}")
+            failed.append(record["source_url"])
+    return upserted, failed
+
+
 def main():
     """
     Main function to scrape and populate ingredient data.
     """
+    parser = argparse.ArgumentParser(description="Scrape incidecoder ingredient pages into the ingredients table.")
+    parser.add_argument("--input-file", type=str, default=INPUT_FILE, help="File with one ingredient URL per line.")
+    parser.add_argument(
+        "--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Worker threads (and pooled connections)."
+    )
+    parser.add_argument(
+        "--rate", type=float, default=1.0 / DELAY, help="Max requests per second per host (<= 0 disables)."
+    )
+    parser.add_argument("--burst", type=float, default=1.0, help="Token bucket burst size per host.")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per upsert request.")
+    parser.add_argument(
+        "--refresh-after-hours",
+        type=float,
+        default=DEFAULT_REFRESH_AFTER_HOURS,
+        help="Skip URLs whose row was updated more recently than this (0 refreshes everything).",
+    )
+    args = parser.parse_args()
+
     logger = setup_logger()
 
-    if not os.path.exists(INPUT_FILE):
-        logger.error(f"Input file not found: {INPUT_FILE}")
+    if not os.path.exists(args.input_file):
+        logger.error(f"Input file not found: {args.input_file}")
         return
 
-    with open(INPUT_FILE) as f:
-        urls = [line.strip() for line in f.readlines()]
+    with open(args.input_file) as f:
+        urls = list(dict.fromkeys(line.strip() for line in f if line.strip()))
 
     supabase = get_supabase_client()
     if not supabase:
         logger.error("Failed to connect to Supabase.")
         return
 
-    logger.info(f"Starting to process {len(urls)} ingredient URLs...")
-
-    for url in tqdm(urls, desc="Populating ingredients"):
+    if args.refresh_after_hours > 0:
+        since = datetime.now(timezone.utc) - timedelta(hours=args.refresh_after_hours)
         try:
-            response = requests.get(url)
-            response.raise_for_status()
+            fresh = fetch_recently_updated(supabase, since)
+        except Exception as e:
+            logger.warning(f"Could not load recently updated ingredients, refreshing all: {e}")
+            fresh = set()
+        skipped = sum(1 for url in urls if url in fresh)
+        urls = [url for url in urls if url not in fresh]
+        logger.info(f"Skipping {skipped} ingredients updated in the last {args.refresh_after_hours:g}h.")
+
+    logger.info(
+        f"Starting to process {len(urls)} ingredient URLs "
+        f"(concurrency={args.concurrency}, rate={args.rate:g}/s per host)..."
+    )
 
-            soup = BeautifulSoup(response.content, "html.parser")
-            ingredient_data = parse_ingredient_page(soup)
+    workers = max(1, args.concurrency)
+    client = HttpClient(
+        timeout=30, max_connections=workers, per_host=workers, rate_per_host=args.rate, burst=args.burst
+    )
+    pending: list[dict] = []
+    upserted = failed = 0
+    failed_upserts: list[str] = []
 
-            if not ingredient_data.get("name"):
+    def flush():
+        nonlocal upserted, failed
+        done, rejected = upsert_batch(supabase, pending, logger)
+        upserted += done
+        failed += len(rejected)
+        failed_upserts.extend(rejected)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(scrape_ingredient, client, url): url for url in urls}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Populating ingredients"):
+            url = futures[future]
+            try:
+                record = future.result()
+            except httpx.HTTPError as e:
+                logger.error(f"Error fetching {url}: {e}")
+                failed += 1
+                continue
+            except Exception as e:
+                logger.error(f"An error occurred while processing {url}: {e}")
+                failed += 1
+                continue
+
+            if record is None:
                 logger.warning(f"Could not parse ingredient name for URL: {url}")
                 continue
 
-            # Prepare data for upsert
-            db_record = {
-                "name": ingredient_data["name"],
-                "what_it_does": ingredient_data["what_it_does"],
-                "our_take": ingredient_data["our_take"],
-                "quick_facts": ingredient_data["quick_facts"],
-                "image_url": ingredient_data["image_url"],
-                "description": ingredient_data["description"],
-                "cosing_info": json.dumps(ingredient_data["cosing_info"]) if ingredient_data["cosing_info"] else None,
-                "source_url": url,
-                "updated_at": "now()",
-            }
-
-            # Upsert into Supabase
-            supabase.table("ingredients").upsert(db_record, on_conflict="name").execute()
-
-            time.sleep(DELAY)
-
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error fetching {url}: {e}")
-        except Exception as e:
-            logger.error(f"An error occurred while processing {url}: {e}")
+            # Upserts run on the main thread as results arrive, so fetching never waits on the db
+            pending.append(record)
+            if len(pending) >= args.batch_size:
+                flush()
+                pending.clear()
+
+    flush()
+    client.close()
 
-    logger.info("Ingredient population script finished.")
+    logger.info(f"Ingredient population script finished: {upserted} upserted, {failed} failed.")
+    if failed_upserts:
+        logger.warning(f"{len(failed_upserts)} ingredients could not be written: " + ", ".join(failed_upserts))
 
 
 if __name__ == "__main__":
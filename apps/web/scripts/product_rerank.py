@@ -0,0 +1,126 @@
+"""
+product_rerank.py
+
+Reranking stage for retrieved product candidates. Within each category, products are
+scored by a weighted mix of query similarity, (review-count damped) rating, popularity and
+key-ingredient overlap, then picked greedily with maximal marginal relevance (MMR) so that
+near-duplicate variants of one product line (same ingredient list, near-identical names)
+don't crowd out the rest of the shortlist.
+"""
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+from supabase import Client
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+STATS_CHUNK = 200
+
+
+@dataclass
+class RerankWeights:
+    similarity: float = 0.6
+    rating: float = 0.15
+    popularity: float = 0.1
+    key_ingredients: float = 0.15
+    # Reviews needed before a product's own rating outweighs the category mean
+    rating_prior_reviews: float = 20.0
+
+
+def fetch_product_stats(supabase: Client, slugs: list[str]) -> dict[str, dict[str, Any]]:
+    """rating / review_count per product_slug (match_products_by_category doesn't return them)."""
+    stats: dict[str, dict[str, Any]] = {}
+    for i in range(0, len(slugs), STATS_CHUNK):
+        response = (
+            supabase.table("products_1")
+            .select("product_slug, rating, review_count")
+            .in_("product_slug", slugs[i : i + STATS_CHUNK])
+            .execute()
+        )
+        stats.update({row["product_slug"]: row for row in response.data})
+    return stats
+
+
+def _minmax(values: np.ndarray) -> np.ndarray:
+    span = values.max() - values.min()
+    return (values - values.min()) / span if span > 0 else np.zeros_like(values)
+
+
+def relevance_scores(products: list[dict[str, Any]], key_ingredient_count: int, weights: RerankWeights) -> np.ndarray:
+    similarity = np.array([p.get("similarity") or 0.0 for p in products], dtype=float)
+    rating = np.array([p.get("rating") or np.nan for p in products], dtype=float)
+    reviews = np.array([p.get("review_count") or 0 for p in products], dtype=float)
+    matched = np.array([len(p.get("matched_key_ingredients") or []) for p in products], dtype=float)
+
+    # Bayesian average: a 5.0 from 2 reviews shouldn't beat a 4.6 from 900
+    prior = np.nanmean(rating) if np.isfinite(rating).any() else 0.0
+    rated = np.where(np.isnan(rating), prior, rating)
+    damped = (rated * reviews + prior * weights.rating_prior_reviews) / (reviews + weights.rating_prior_reviews)
+
+    return (
+        weights.similarity * _minmax(similarity)
+        + weights.rating * _minmax(damped)
+        + weights.popularity * _minmax(np.log1p(reviews))
+        + weights.key_ingredients * matched / max(1, key_ingredient_count)
+    )
+
+
+def redundancy_matrix(products: list[dict[str, Any]], name_vectors: np.ndarray | None = None) -> np.ndarray:
+    """Pairwise similarity: the max of ingredient-list Jaccard and (normalised) name embedding cosine."""
+    vocab: dict[str, int] = {}
+    rows = [[vocab.setdefault(s, len(vocab)) for s in p.get("ingredient_slugs") or []] for p in products]
+    incidence = np.zeros((len(products), max(1, len(vocab))), dtype=np.float32)
+    for i, cols in enumerate(rows):
+        incidence[i, cols] = 1.0
+    inter = incidence @ incidence.T
+    sizes = incidence.sum(axis=1)
+    union = sizes[:, None] + sizes[None, :] - inter
+    jaccard = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+    if name_vectors is None:
+        return jaccard
+    return np.maximum(jaccard, np.clip(name_vectors @ name_vectors.T, 0.0, 1.0))
+
+
+def mmr_select(relevance: np.ndarray, redundancy: np.ndarray, top_n: int, diversity: float) -> list[int]:
+    """Greedy MMR: argmax of (1 - diversity) * relevance - diversity * max similarity to the picks so far."""
+    n = len(relevance)
+    selected: list[int] = []
+    max_sim = np.zeros(n)
+    available = np.ones(n, dtype=bool)
+    for _ in range(min(top_n, n)):
+        scores = np.where(available, (1 - diversity) * relevance - diversity * max_sim, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        max_sim = np.maximum(max_sim, redundancy[best])
+    return selected
+
+
+def rerank_products(
+    products: list[dict[str, Any]],
+    key_ingredient_count: int,
+    top_n: int,
+    diversity: float = 0.3,
+    model: "SentenceTransformer | None" = None,
+    weights: RerankWeights | None = None,
+) -> list[dict[str, Any]]:
+    """Keeps the top_n MMR picks per category, in pick order; records `rerank_score` on each."""
+    weights = weights or RerankWeights()
+    by_category: dict[str, list[dict[str, Any]]] = {}
+    for product in products:
+        by_category.setdefault(product.get("category") or "", []).append(product)
+
+    kept: list[dict[str, Any]] = []
+    for group in by_category.values():
+        relevance = relevance_scores(group, key_ingredient_count, weights)
+        name_vectors = None
+        if model is not None:
+            names = [f"{p.get('brand') or ''} {p.get('name') or ''}".strip() for p in group]
+            name_vectors = np.asarray(model.encode(names, normalize_embeddings=True))
+        for i in mmr_select(relevance, redundancy_matrix(group, name_vectors), top_n, diversity):
+            group[i]["rerank_score"] = round(float(relevance[i]), 4)
+            kept.append(group[i])
+    return kept
@@ -0,0 +1,105 @@
+"""
+recommendation_rules.py
+
+Deterministic pre-review checks for generated recommendations. These catch the
+mechanical rejections (missing AM sunscreen, products outside the retrieved candidates,
+"avoid"-level ingredient conflicts in the same session, ingredients the philosophy says
+to avoid) locally, so the generator can be re-prompted without spending a reviewer call.
+"""
+
+import re
+from typing import Any
+
+from ingredient_conflicts import ConflictIndex
+from skin_lib import Recommendations, RoutineStep, SkincarePhilosophy
+
+SUNSCREEN_CATEGORY = "sunscreen"
+UV_FILTER_ACTIVES = {"chemical-uv-filter", "mineral-uv-filter"}
+SUNSCREEN_STEP_RX = re.compile(r"\b(sunscreen|spf|sun protection|uv protection)\b", re.IGNORECASE)
+
+_non_slug_rx = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_term(value: str) -> str:
+    """Slug-style key for loose matching: 'Retinoids' / 'retinoid' / 'Retinoid' all map to 'retinoid'."""
+    slug = _non_slug_rx.sub("-", value.lower()).strip("-")
+    return slug[:-1] if slug.endswith("s") and len(slug) > 3 else slug
+
+
+def product_terms(product: dict[str, Any]) -> set[str]:
+    """Normalized active-ingredient families and ingredient slugs of a retrieved product."""
+    terms: set[str] = set()
+    for key in ("active_ingredients", "ingredient_slugs"):
+        values = product.get(key)
+        if isinstance(values, list):
+            terms.update(normalize_term(v) for v in values if isinstance(v, str))
+    return terms
+
+
+def iter_sessions(recommendations: Recommendations) -> list[tuple[str, list[RoutineStep]]]:
+    routine = recommendations.routine
+    sessions = [("AM", routine.am), ("PM", routine.pm)]
+    if routine.weekly:
+        sessions.append(("Weekly", routine.weekly))
+    return sessions
+
+
+def validate_recommendations(
+    recommendations: Recommendations,
+    candidates: list[dict[str, Any]],
+    philosophy: SkincarePhilosophy,
+    conflicts: ConflictIndex | None = None,
+) -> list[str]:
+    """
+    Runs the mechanical checks and returns one actionable note per violation
+    (an empty list means the routine can go to the reviewer). Without an ingredient-backed
+    conflict index only the products' active-ingredient families are checked.
+    """
+    conflicts = conflicts or ConflictIndex()
+    by_slug = {p["product_slug"]: p for p in candidates if p.get("product_slug")}
+    avoid = {normalize_term(term): term for term in philosophy.ingredients_to_avoid if term.strip()}
+    notes: list[str] = []
+
+    for session, steps in iter_sessions(recommendations):
+        for step in steps:
+            for rec in step.products:
+                product = by_slug.get(rec.product_slug)
+                if product is None:
+                    notes.append(
+                        f"{session} step '{step.step}': product_slug '{rec.product_slug}' is not in the provided "
+                        "product list. Only recommend products from the curated list, using their exact product_slug."
+                    )
+                    continue
+                for key in sorted(product_terms(product) & avoid.keys()):
+                    notes.append(
+                        f"{session} step '{step.step}': '{rec.product_slug}' contains '{avoid[key]}', which the "
+                        "Skincare Philosophy lists under ingredients_to_avoid. Replace it."
+                    )
+
+    notes += [
+        hit.describe() for hit in conflicts.check_routine(recommendations.routine, by_slug) if hit.severity == "avoid"
+    ]
+
+    if not has_am_sunscreen(recommendations, by_slug):
+        notes.append("The AM routine has no sunscreen. Add an SPF step with a product from the Sunscreen category.")
+
+    return notes
+
+
+def has_am_sunscreen(recommendations: Recommendations, by_slug: dict[str, dict[str, Any]]) -> bool:
+    for step in recommendations.routine.am:
+        for rec in step.products:
+            product = by_slug.get(rec.product_slug)
+            if product is None:
+                continue
+            if normalize_term(product.get("category") or "") == SUNSCREEN_CATEGORY:
+                return True
+            if product_terms(product) & UV_FILTER_ACTIVES:
+                return True
+        if (
+            step.products
+            and SUNSCREEN_STEP_RX.search(step.step)
+            and any(rec.product_slug in by_slug for rec in step.products)
+        ):
+            return True
+    return False
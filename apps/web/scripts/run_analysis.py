@@ -17,23 +17,30 @@ powered by Pydantic AI for robust, structured output.
 """
 
 import argparse
+import asyncio
 import json
 import os
 import sys
-import time
 
 from dotenv import load_dotenv
 from pydantic_ai import Agent
 from pydantic_ai.messages import BinaryContent
 from skin_lib import (
+    AnalysisProgress,
     FullSkinAnalysis,
+    UsageLedger,
     create_agent,
     download_from_s3,
     get_media_type,
     get_supabase_client,
     load_json_context,
     load_system_prompt,
+    log_cache_usage,
+    prompt_cache_key,
+    run_agent_streaming,
     setup_logger,
+    setup_tracing,
+    trace_span,
 )
 
 # Load environment variables from .env file
@@ -108,6 +115,12 @@ def main():
         type=str,
         help="The specific analysis ID to update (Analysis-Centric mode).",
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the structured output, recording time-to-first-token and writing partial "
+        "progress (concerns as they arrive) to skin_analyses.progress when --analysis-id is set.",
+    )
 
     args = parser.parse_args()
     logger.info(f"Starting analysis with arguments: {args}")
@@ -143,6 +156,8 @@ def main():
             logger.error(f"Failed to resolve user by name: {e}")
             sys.exit(1)
 
+    run_id = setup_tracing("run_analysis", user_id=args.user_id, analysis_id=args.analysis_id)
+
     # --- Image and Context Loading ---
     logger.info("Loading images and context...")
     image_paths = []
@@ -197,7 +212,8 @@ def main():
         try:
             supabase = get_supabase_client()
             logger.info(f"Fetching intake submission for user {args.user_id}...")
-            res = supabase.table("intake_submissions").select("*").eq("user_id", args.user_id).limit(1).execute()
+            with trace_span("db.select", table="intake_submissions"):
+                res = supabase.table("intake_submissions").select("*").eq("user_id", args.user_id).limit(1).execute()
             if res.data:
                 context = res.data[0]
                 logger.success("Loaded user context from Supabase.")
@@ -219,33 +235,76 @@ def main():
     if text_parts:
         message_content.append("\n".join(text_parts))
 
-    for image_path in image_paths:
-        with open(image_path, "rb") as f:
-            image_data = f.read()
-        media_type = get_media_type(image_path)
-        message_content.append(BinaryContent(data=image_data, media_type=media_type))
+    with trace_span("image.prep", images=len(image_paths)) as span:
+        for image_path in image_paths:
+            with open(image_path, "rb") as f:
+                image_data = f.read()
+            media_type = get_media_type(image_path)
+            message_content.append(BinaryContent(data=image_data, media_type=media_type))
+        span.set(bytes=sum(len(part.data) for part in message_content if isinstance(part, BinaryContent)))
 
     logger.debug(f"LLM Payload (text parts): {''.join(text_parts)}")
     logger.info(f"LLM Payload includes {len(image_paths)} images.")
 
     # --- Agent Configuration ---
     logger.info(f"Configuring agent with model: {args.model}")
-    model, model_settings = create_agent(args.model, args.api_key, args.reasoning_effort)
+    model, model_settings = create_agent(
+        args.model, args.api_key, args.reasoning_effort, cache_key=prompt_cache_key(analysis_prompt)
+    )
     logger.success("Agent configured.")
 
     # --- Run Analysis ---
+    ledger_client = None
+    if args.user_id:
+        try:
+            ledger_client = get_supabase_client()
+        except ValueError as e:
+            logger.warning(f"Usage will not be recorded in usage_ledger: {e}")
+    ledger = UsageLedger(ledger_client, run_id, "run_analysis", user_id=args.user_id, analysis_id=args.analysis_id)
+
     logger.info("Running skin analysis agent...")
-    start_time = time.time()
     analysis_agent = Agent(
         model,
         output_type=FullSkinAnalysis,
         instructions=analysis_prompt,
     )
-    analysis_result = analysis_agent.run_sync(message_content, model_settings=model_settings)
-    end_time = time.time()
-    logger.success(f"Skin analysis completed in {end_time - start_time:.2f} seconds.")
+    with trace_span("llm.analysis", stream=args.stream) as llm_span:
+        if args.stream:
+            progress = (
+                AnalysisProgress(get_supabase_client(), args.analysis_id, "analysis") if args.analysis_id else None
+            )
+
+            def report(partial: dict):
+                analysis = partial.get("analysis") or {}
+                concerns = [c["name"] for c in analysis.get("concerns") or [] if isinstance(c, dict) and c.get("name")]
+                if progress:
+                    progress.update(sections=list(partial), concerns=concerns)
+
+            analysis_output, timing = asyncio.run(
+                run_agent_streaming(analysis_agent, message_content, model_settings, on_progress=report)
+            )
+            if timing.ttft_s is not None:
+                logger.info(f"Time to first token: {timing.ttft_s:.2f}s (total {timing.total_s:.2f}s).")
+                llm_span.set(ttft_s=round(timing.ttft_s, 3))
+            usage = timing.usage
+            if progress:
+                progress.update(
+                    sections=list(FullSkinAnalysis.model_fields),
+                    concerns=[c.name for c in analysis_output.analysis.concerns],
+                    complete=True,
+                    ttft_s=timing.ttft_s,
+                    total_s=round(timing.total_s, 2),
+                )
+        else:
+            analysis_result = analysis_agent.run_sync(message_content, model_settings=model_settings)
+            usage = analysis_result.usage()
+            analysis_output = analysis_result.output
+        log_cache_usage("analysis", usage)
+        ledger.record("analysis", args.model, usage, llm_span)
+    logger.success(f"Skin analysis completed in {llm_span.duration_s:.2f} seconds.")
+    logger.info(f"Usage: {ledger.summary()}.")
 
-    output_data = analysis_result.output.model_dump()
+    output_data = analysis_output.model_dump()
 
     # Transform the 'concerns' list into a dictionary
     logger.info("Post-processing analysis output...")
@@ -273,7 +332,8 @@ def main():
                 # We need to construct the update payload
                 update_payload = {"analysis_data": output_data, "image_urls": s3_keys, "status": "completed"}
 
-                res = supabase.table("skin_analyses").update(update_payload).eq("id", args.analysis_id).execute()
+                with trace_span("db.write", table="skin_analyses", op="update"):
+                    res = supabase.table("skin_analyses").update(update_payload).eq("id", args.analysis_id).execute()
 
                 if not res.data:
                     logger.error(f"Analysis ID {args.analysis_id} not found or update failed (RLS?).")
@@ -285,14 +345,15 @@ def main():
             else:
                 # Legacy / Fallback: Insert new record
                 logger.info("Inserting new analysis (Legacy Mode)...")
-                supabase.table("skin_analyses").insert(
-                    {
-                        "user_id": args.user_id,
-                        "analysis_data": output_data,
-                        "image_urls": s3_keys,
-                        "status": "completed",  # Auto-complete for legacy inserts
-                    }
-                ).execute()
+                with trace_span("db.write", table="skin_analyses", op="insert"):
+                    supabase.table("skin_analyses").insert(
+                        {
+                            "user_id": args.user_id,
+                            "analysis_data": output_data,
+                            "image_urls": s3_keys,
+                            "status": "completed",  # Auto-complete for legacy inserts
+                        }
+                    ).execute()
                 logger.success(f"Successfully saved new analysis for user {args.user_id}.")
 
             # ---------------------------------------------------------
@@ -2,7 +2,7 @@
 # /// script
 # requires-python = ">=3.10"
 # dependencies = [
-#     "requests",
+#     "httpx[http2]",
 #     "beautifulsoup4",
 #     "tqdm"
 # ]
@@ -10,22 +10,42 @@
 """
 scrape_ingredients.py
 
-A script to scrape ingredient URLs from incidecoder.com.
+A script to discover ingredient URLs on incidecoder.com.
+
+Discovery walks a frontier of sitemaps (from robots.txt `Sitemap:` lines, falling back to
+/sitemap.xml) and paginated /ingredients listing pages, following sitemap indexes and
+pagination links. Every listing page is fetched once per run; the crawl stops after
+--patience consecutive listing pages or ingredient sitemaps that yield no new ingredient URLs
+(sitemap indexes and sitemaps of other page types never count, and queueing new child sitemaps
+resets the streak). The set of visited pages and any unfinished frontier are persisted in a
+state file so the next run resumes.
+
+Ingredient URLs keep the original `BASE_URL + href` format, so ingredient_urls.txt and the
+ingredients.source_url rows written by earlier runs still match.
 """
 
+import argparse
+import gzip
+import json
 import os
 import time
+import urllib.parse
+import xml.etree.ElementTree as ET
+from collections import deque
 
-import requests
+import httpx
 from bs4 import BeautifulSoup  # type: ignore
+from scrape_lib import DEFAULT_ROBOTS_CACHE_DIR, HttpClient, RobotsCache
 from tqdm import tqdm
 
 BASE_URL = "https://incidecoder.com"
 INGREDIENTS_PATH = "/ingredients"
 OUTPUT_DIR = "data"
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, "ingredient_urls.txt")
-ITERATIONS = 100
+STATE_FILE = os.path.join(OUTPUT_DIR, "ingredient_discovery_state.json")
 DELAY = 1
+DEFAULT_PATIENCE = 5
+DEFAULT_REVISIT_HOURS = 24.0
 
 
 def load_existing_urls():
@@ -38,33 +58,174 @@ def load_existing_urls():
         return {line.strip() for line in f if line.strip()}
 
 
-def scrape_ingredient_urls():
+def load_state(path):
+    """
+    Loads the persisted crawl state: {"visited": {page_url: fetched_at}, "frontier": [page_url, ...]}.
+    """
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {"visited": {}, "frontier": []}
+    return {"visited": dict(state.get("visited") or {}), "frontier": list(state.get("frontier") or [])}
+
+
+def save_state(path, state):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def is_ingredient_url(url):
+    parsed = urllib.parse.urlparse(url)
+    return parsed.netloc == urllib.parse.urlparse(BASE_URL).netloc and parsed.path.startswith(INGREDIENTS_PATH + "/")
+
+
+def is_listing_url(url):
+    parsed = urllib.parse.urlparse(url)
+    return parsed.netloc == urllib.parse.urlparse(BASE_URL).netloc and parsed.path.rstrip("/") == INGREDIENTS_PATH
+
+
+def canonical(url):
+    """Drops fragments and trailing slashes so the same listing/sitemap page is only queued once."""
+    parsed = urllib.parse.urlparse(url)
+    return urllib.parse.urlunparse(parsed._replace(path=parsed.path.rstrip("/") or "/", fragment=""))
+
+
+def parse_sitemap(content):
+    """
+    Returns (child_sitemaps, page_urls) from a sitemap index or urlset (optionally gzipped).
+    """
+    if content[:2] == b"\x1f\x8b":
+        content = gzip.decompress(content)
+    root = ET.fromstring(content)
+    locs = [el.text.strip() for el in root.iter() if el.tag.endswith("loc") and el.text]
+    if root.tag.endswith("sitemapindex"):
+        return locs, []
+    return [], locs
+
+
+def parse_listing(content):
+    """
+    Returns (pagination_urls, ingredient_urls) linked from an /ingredients listing page.
+
+    Ingredient URLs are not canonicalised: a root-relative href resolves to exactly
+    `BASE_URL + href`, the format the stored URLs have always used.
+    """
+    soup = BeautifulSoup(content, "html.parser")
+    pages, ingredients = [], []
+    for a_tag in soup.find_all("a", href=True):
+        url = urllib.parse.urljoin(BASE_URL + INGREDIENTS_PATH, a_tag["href"])
+        if is_ingredient_url(url):
+            ingredients.append(url)
+        elif is_listing_url(url):
+            pages.append(canonical(url))
+    return pages, ingredients
+
+
+def discover_sitemaps(client, robots_cache):
+    """
+    Sitemap URLs advertised in robots.txt, or the conventional /sitemap.xml.
+    """
+    robots_url = RobotsCache.robots_url(BASE_URL)
+    rp = robots_cache.get(robots_url)
+    if rp is None:
+        try:
+            resp = client.get(robots_url)
+            rp = robots_cache.put(robots_url, resp.status_code, resp.text)
+        except httpx.HTTPError as e:
+            print(f"Could not fetch {robots_url}: {e}")
+    return rp, list((rp and rp.site_maps()) or [BASE_URL + "/sitemap.xml"])
+
+
+def scrape_ingredient_urls(
+    patience=DEFAULT_PATIENCE,
+    max_pages=None,
+    rate=1.0 / DELAY,
+    revisit_hours=DEFAULT_REVISIT_HOURS,
+    state_file=STATE_FILE,
+    use_sitemap=True,
+    robots_cache_dir=DEFAULT_ROBOTS_CACHE_DIR,
+):
     """
-    Scrapes ingredient URLs from incidecoder.com by repeatedly fetching the ingredients page.
+    Discovers ingredient URLs by walking sitemaps and paginated listing pages.
     """
     ingredient_urls = load_existing_urls()
     initial_count = len(ingredient_urls)
     print(f"Loaded {initial_count} existing URLs from {OUTPUT_FILE}")
 
-    print(f"Scraping {BASE_URL}{INGREDIENTS_PATH} for new ingredient URLs...")
+    state = load_state(state_file)
+    client = HttpClient(timeout=30, per_host=1, rate_per_host=rate)
+    rp, sitemaps = discover_sitemaps(client, RobotsCache(robots_cache_dir))
+
+    # Resume the saved frontier first; seeds are always re-fetched, other pages only once per --revisit-hours
+    seeds = [canonical(BASE_URL + INGREDIENTS_PATH)] + (sitemaps if use_sitemap else [])
+    sitemap_urls = set(sitemaps) if use_sitemap else set()
+    frontier = deque(dict.fromkeys(state["frontier"] + seeds))
+    queued = set(frontier)
+    revisit_after = max(0.0, revisit_hours) * 3600
+    now = time.time()
+
+    fetched = dry_streak = 0
+    print(f"Walking {len(frontier)} seed/frontier pages from {BASE_URL}...")
+    progress = tqdm(desc="Discovery pages", unit="page")
+    while frontier and dry_streak < patience and (max_pages is None or fetched < max_pages):
+        url = frontier.popleft()
+        if url not in seeds and now - state["visited"].get(url, 0.0) < revisit_after:
+            continue
+        if rp is not None and not rp.can_fetch("*", url):
+            continue
 
-    for _ in tqdm(range(ITERATIONS), desc="Scraping pages"):
         try:
-            response = requests.get(f"{BASE_URL}{INGREDIENTS_PATH}")
+            response = client.get(url)
             response.raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"An error occurred fetching {url}: {e}")
+            continue
+        fetched += 1
+        state["visited"][url] = time.time()
+        progress.update(1)
 
-            soup = BeautifulSoup(response.content, "html.parser")
+        try:
+            if url in sitemap_urls:
+                children, locs = parse_sitemap(response.content)
+                sitemap_urls.update(children)
+                children += [canonical(u) for u in locs if is_listing_url(u)]
+                found = [u for u in locs if is_ingredient_url(u)]
+                # Sitemap indexes and sitemaps of other page types can't yield ingredients
+                counts_toward_streak = bool(found)
+            else:
+                children, found = parse_listing(response.content)
+                counts_toward_streak = True
+        except ET.ParseError as e:
+            print(f"Could not parse {url}: {e}")
+            continue
 
-            for a_tag in soup.find_all("a", href=True):
-                href = a_tag["href"]
-                if href.startswith("/ingredients/"):
-                    ingredient_urls.add(BASE_URL + href)
+        queued_sitemaps = 0
+        for child in children:
+            if child not in queued:
+                queued.add(child)
+                frontier.append(child)
+                queued_sitemaps += child in sitemap_urls
 
-            time.sleep(DELAY)
+        new = [u for u in found if u not in ingredient_urls]
+        ingredient_urls.update(new)
+        # New child sitemaps are unexplored ground, so they restart the patience window
+        if new or queued_sitemaps:
+            dry_streak = 0
+        elif counts_toward_streak:
+            dry_streak += 1
+        progress.set_postfix(new=len(ingredient_urls) - initial_count, frontier=len(frontier))
+    progress.close()
+    client.close()
 
-        except requests.exceptions.RequestException as e:
-            print(f"An error occurred: {e}")
-            break
+    if dry_streak >= patience:
+        print(f"Stopping: {patience} consecutive ingredient pages yielded no new ingredient URLs.")
+    state["frontier"] = list(frontier)
+    save_state(state_file, state)
+    print(f"Fetched {fetched} pages; {len(frontier)} left in the frontier (saved to {state_file}).")
 
     return ingredient_urls
 
@@ -86,7 +247,34 @@ def save_urls_to_file(urls, initial_count):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Discover incidecoder ingredient URLs via sitemaps and listings.")
+    parser.add_argument(
+        "--patience", type=int, default=DEFAULT_PATIENCE, help="Stop after this many pages with no new URLs."
+    )
+    parser.add_argument("--max-pages", type=int, default=None, help="Hard cap on pages fetched this run.")
+    parser.add_argument("--rate", type=float, default=1.0 / DELAY, help="Max requests per second.")
+    parser.add_argument(
+        "--revisit-hours",
+        type=float,
+        default=DEFAULT_REVISIT_HOURS,
+        help="Skip non-seed pages visited more recently than this.",
+    )
+    parser.add_argument("--state-file", type=str, default=STATE_FILE, help="Persisted visited-set and frontier.")
+    parser.add_argument("--no-sitemap", action="store_true", help="Only walk the paginated listing pages.")
+    parser.add_argument(
+        "--robots-cache-dir", type=str, default=DEFAULT_ROBOTS_CACHE_DIR, help="robots.txt cache directory."
+    )
+    args = parser.parse_args()
+
     initial_url_count = len(load_existing_urls())
-    all_urls = scrape_ingredient_urls()
+    all_urls = scrape_ingredient_urls(
+        patience=args.patience,
+        max_pages=args.max_pages,
+        rate=args.rate,
+        revisit_hours=args.revisit_hours,
+        state_file=args.state_file,
+        use_sitemap=not args.no_sitemap,
+        robots_cache_dir=args.robots_cache_dir,
+    )
     if all_urls:
         save_urls_to_file(all_urls, initial_url_count)
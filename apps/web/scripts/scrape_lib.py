@@ -0,0 +1,630 @@
+"""
+scrape_lib.py
+
+A shared library for the scraper scripts (skinsort, incidecoder, ingredient crawlers),
+containing the on-disk HTTP page cache, the robots.txt cache, per-host rate limiting,
+the pooled/retrying HTTP clients and related helpers.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import gzip
+import hashlib
+import importlib.util
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+from collections import deque
+from collections.abc import AsyncIterator, Iterator, Mapping
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from urllib import robotparser
+
+import httpx
+
+DEFAULT_CACHE_DIR = ".cache/http"
+DEFAULT_CACHE_TTL_HOURS = 24.0
+DEFAULT_ROBOTS_CACHE_DIR = ".cache/robots"
+DEFAULT_ROBOTS_TTL_HOURS = 24.0
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_PER_HOST = 4
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+_slug_rx = re.compile("[^A-Za-z0-9.-]+")
+
+
+class CacheMiss(Exception):
+    """Raised in offline (--from-cache) mode when a URL has no cached body."""
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    body: str
+    etag: str | None = None
+    last_modified: str | None = None
+    fetched_at: float = 0.0
+
+
+class HttpCache:
+    """
+    On-disk HTTP page cache keyed by URL.
+
+    Each entry is a gzip-compressed body plus a JSON sidecar holding the validators
+    (ETag / Last-Modified) and the time the body was last confirmed by the server.
+    Entries younger than `ttl_hours` are served without any request; older ones are
+    revalidated with If-None-Match / If-Modified-Since. With `offline=True` every
+    cached body is served regardless of age and misses raise `CacheMiss`.
+    """
+
+    def __init__(
+        self,
+        root: str = DEFAULT_CACHE_DIR,
+        ttl_hours: float = DEFAULT_CACHE_TTL_HOURS,
+        offline: bool = False,
+    ):
+        self.root = root
+        self.ttl_seconds = max(0.0, ttl_hours) * 3600
+        self.offline = offline
+
+    def _paths(self, url: str) -> tuple[str, str]:
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.root, key[:2], key)
+        return base + ".html.gz", base + ".json"
+
+    def lookup(self, url: str) -> CacheEntry | None:
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, encoding="utf-8") as fh:
+                meta = json.load(fh)
+            with gzip.open(body_path, "rt", encoding="utf-8") as fh:
+                body = fh.read()
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(
+            url=url,
+            body=body,
+            etag=meta.get("etag"),
+            last_modified=meta.get("last_modified"),
+            fetched_at=float(meta.get("fetched_at") or 0.0),
+        )
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return self.offline or (time.time() - entry.fetched_at) < self.ttl_seconds
+
+    @staticmethod
+    def conditional_headers(entry: CacheEntry | None) -> dict[str, str]:
+        headers: dict[str, str] = {}
+        if entry is None:
+            return headers
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def store(self, url: str, body: str, headers: Mapping[str, str]) -> CacheEntry:
+        entry = CacheEntry(
+            url=url,
+            body=body,
+            etag=headers.get("etag"),
+            last_modified=headers.get("last-modified"),
+            fetched_at=time.time(),
+        )
+        body_path, _ = self._paths(url)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        tmp_path = f"{body_path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as fh:
+            fh.write(body)
+        os.replace(tmp_path, body_path)
+        self._write_meta(entry)
+        return entry
+
+    def revalidated(self, entry: CacheEntry, headers: Mapping[str, str]) -> CacheEntry:
+        """Records a 304 Not Modified: keeps the body, refreshes validators and timestamp."""
+        entry.etag = headers.get("etag") or entry.etag
+        entry.last_modified = headers.get("last-modified") or entry.last_modified
+        entry.fetched_at = time.time()
+        self._write_meta(entry)
+        return entry
+
+    def _write_meta(self, entry: CacheEntry) -> None:
+        _, meta_path = self._paths(entry.url)
+        meta = {
+            "url": entry.url,
+            "etag": entry.etag,
+            "last_modified": entry.last_modified,
+            "fetched_at": entry.fetched_at,
+        }
+        tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        os.replace(tmp_path, meta_path)
+
+    def iter_entries(self) -> Iterator[CacheEntry]:
+        """Yields every cached entry (used by the offline parser benchmarks)."""
+        if not os.path.isdir(self.root):
+            return
+        for shard in sorted(os.listdir(self.root)):
+            shard_dir = os.path.join(self.root, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in sorted(os.listdir(shard_dir)):
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(shard_dir, name), encoding="utf-8") as fh:
+                        url = json.load(fh).get("url")
+                except (OSError, ValueError):
+                    continue
+                entry = self.lookup(url) if url else None
+                if entry:
+                    yield entry
+
+
+class RobotsCache:
+    """
+    Per-host robots.txt cache with a TTL.
+
+    Parsed rules are kept in memory for the life of the process and, when `root` is set,
+    the raw response (status + body) is persisted so later runs skip the fetch until the
+    TTL expires. Server errors are never cached, so a flaky robots.txt is retried.
+    """
+
+    def __init__(self, root: str | None = DEFAULT_ROBOTS_CACHE_DIR, ttl_hours: float = DEFAULT_ROBOTS_TTL_HOURS):
+        self.root = root
+        self.ttl_seconds = max(0.0, ttl_hours) * 3600
+        self._memory: dict[str, tuple[robotparser.RobotFileParser, float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def robots_url(url: str) -> str:
+        parsed = urllib.parse.urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc}/robots.txt"
+
+    def _path(self, robots_url: str) -> str:
+        host = urllib.parse.urlparse(robots_url).netloc
+        return os.path.join(self.root, _slug_rx.sub("_", host) + ".json")
+
+    def get(self, robots_url: str) -> robotparser.RobotFileParser | None:
+        now = time.time()
+        with self._lock:
+            hit = self._memory.get(robots_url)
+        if hit and now - hit[1] < self.ttl_seconds:
+            return hit[0]
+        if not self.root:
+            return None
+        try:
+            with open(self._path(robots_url), encoding="utf-8") as fh:
+                saved = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        fetched_at = float(saved.get("fetched_at") or 0.0)
+        if now - fetched_at >= self.ttl_seconds:
+            return None
+        rp = self.build_parser(robots_url, int(saved.get("status") or 0), saved.get("body") or "")
+        if rp is not None:
+            with self._lock:
+                self._memory[robots_url] = (rp, fetched_at)
+        return rp
+
+    def put(self, robots_url: str, status: int, body: str) -> robotparser.RobotFileParser | None:
+        rp = self.build_parser(robots_url, status, body)
+        if rp is None:
+            return None
+        fetched_at = time.time()
+        with self._lock:
+            self._memory[robots_url] = (rp, fetched_at)
+        if self.root:
+            path = self._path(robots_url)
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump({"url": robots_url, "status": status, "body": body, "fetched_at": fetched_at}, fh)
+            os.replace(tmp_path, path)
+        return rp
+
+    @staticmethod
+    def build_parser(robots_url: str, status: int, body: str) -> robotparser.RobotFileParser | None:
+        """Same status semantics as RobotFileParser.read(); None means "could not evaluate"."""
+        rp = robotparser.RobotFileParser(robots_url)
+        if status in (401, 403):
+            rp.disallow_all = True
+        elif 400 <= status < 500:
+            rp.allow_all = True
+        elif 200 <= status < 300:
+            rp.parse(body.splitlines())
+        else:
+            return None
+        return rp
+
+
+# --- Politeness ---
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` requests per second with bursts of up to `burst`.
+
+    Callers reserve a slot under a lock and then sleep outside it, so the bucket can be
+    shared by threads (`acquire`) and by coroutines on one event loop (`acquire_async`).
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Takes one token (possibly going into debt) and returns how long to wait for it."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1.0
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class HostRateLimiter:
+    """One `TokenBucket` per host, created on first use."""
+
+    def __init__(self, rate_per_host: float, burst: float = 1.0):
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = urllib.parse.urlparse(url).netloc
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate_per_host, self.burst)
+            return self._buckets[host]
+
+    def wait(self, url: str) -> None:
+        self.bucket(url).acquire()
+
+    async def wait_async(self, url: str) -> None:
+        await self.bucket(url).acquire_async()
+
+
+# --- HTTP clients ---
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Jittered exponential backoff for transport errors and retryable statuses (429/5xx).
+
+    A numeric or HTTP-date Retry-After header overrides the computed delay (capped at
+    `max_delay`). After the last attempt a retryable response is returned to the caller
+    as-is, so `raise_for_status()` still reports the real status.
+    """
+
+    attempts: int = 4
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    statuses: frozenset[int] = field(default_factory=lambda: RETRY_STATUSES)
+
+    def delay(self, attempt: int, response: httpx.Response | None = None) -> float:
+        retry_after = parse_retry_after(response.headers.get("retry-after")) if response is not None else None
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        # "Full jitter": uniform in [0, base * 2^attempt]
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2**attempt)))
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (httpx[http2]); fall back to HTTP/1.1 without it."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def _client_kwargs(headers, timeout, max_connections, http2) -> dict:
+    return {
+        "headers": dict(headers or {}),
+        "timeout": timeout,
+        "follow_redirects": True,
+        "http2": http2_available() if http2 is None else http2,
+        "limits": httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+    }
+
+
+def _host(url: str) -> str:
+    return urllib.parse.urlparse(url).netloc
+
+
+class HttpClient:
+    """
+    Shared synchronous HTTP client for the scrapers: one keep-alive connection pool
+    (HTTP/2 when `h2` is installed), at most `per_host` in-flight requests per host,
+    optional per-host token-bucket pacing and `RetryPolicy` retries. Safe to share
+    between threads.
+    """
+
+    def __init__(
+        self,
+        *,
+        headers: Mapping[str, str] | None = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        per_host: int = DEFAULT_PER_HOST,
+        rate_per_host: float = 0.0,
+        burst: float = 1.0,
+        retry: RetryPolicy | None = None,
+        http2: bool | None = None,
+    ):
+        self.client = httpx.Client(**_client_kwargs(headers, timeout, max_connections, http2))
+        self.per_host = max(1, per_host)
+        self.limiter = HostRateLimiter(rate_per_host, burst)
+        self.retry = retry or RetryPolicy()
+        self._slots: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, url: str) -> threading.BoundedSemaphore:
+        host = _host(url)
+        with self._lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._slots[host]
+
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        slot = self._slot(url)
+        attempt = 0
+        while True:
+            last = attempt + 1 >= self.retry.attempts
+            self.limiter.wait(url)
+            try:
+                with slot:
+                    response = self.client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                if last:
+                    raise
+                delay = self.retry.delay(attempt)
+            else:
+                if response.status_code not in self.retry.statuses or last:
+                    return response
+                delay = self.retry.delay(attempt, response)
+            attempt += 1
+            time.sleep(delay)
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("HEAD", url, **kwargs)
+
+    def close(self) -> None:
+        self.client.close()
+
+    def __enter__(self) -> HttpClient:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for one event loop.
+
+    Every healthy response (no 429/5xx/transport error, latency within `latency_tolerance`
+    times the recent baseline) grows the limit by 1/limit, i.e. about +1 per round trip
+    of the whole window. A 429, any 5xx or timeout/transport error multiplies it by `backoff`,
+    at most once per baseline latency so one burst of failures counts once. Keeps a
+    rolling window of latencies and outcomes for `metrics()`. A cancelled request says
+    nothing about the server and only frees its slot (`abandon`).
+    """
+
+    def __init__(
+        self,
+        initial: int = 5,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        backoff: float = 0.5,
+        latency_tolerance: float = 3.0,
+        window: int = 200,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.errors: deque[bool] = deque(maxlen=window)
+        self._baseline: float | None = None
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: float, status: int | None) -> None:
+        """Records one request; `status=None` means it failed at the transport level."""
+        overloaded = status is None or status == 429 or status >= 500
+        self.latencies.append(latency)
+        self.errors.append(overloaded)
+        now = time.monotonic()
+        if overloaded:
+            if now - self._last_decrease >= (self._baseline or 1.0):
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self._last_decrease = now
+        else:
+            # Slowly forget old minima so the baseline tracks the current network
+            self._baseline = latency if self._baseline is None else min(latency, self._baseline * 1.01)
+            if latency <= self.latency_tolerance * self._baseline:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+        await self.abandon()
+
+    async def abandon(self) -> None:
+        """Frees the slot of a cancelled request without recording an outcome."""
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def metrics(self) -> dict[str, str | int]:
+        """In-flight, current limit, p50/p95 latency and error rate over the rolling window."""
+        ordered = sorted(self.latencies)
+
+        def pct(q: float) -> str:
+            return f"{1000 * ordered[min(len(ordered) - 1, int(q * len(ordered)))]:.0f}ms" if ordered else "-"
+
+        err = sum(self.errors) / len(self.errors) if self.errors else 0.0
+        return {
+            "inflight": self.in_flight,
+            "limit": int(self.limit),
+            "p50": pct(0.5),
+            "p95": pct(0.95),
+            "err": f"{err:.1%}",
+        }
+
+
+class AsyncHttpClient:
+    """
+    The asyncio counterpart of `HttpClient`, built on one httpx.AsyncClient. Passing an
+    `AdaptiveLimiter` replaces the fixed per-host cap with a global AIMD limit.
+    """
+
+    def __init__(
+        self,
+        *,
+        headers: Mapping[str, str] | None = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        per_host: int = DEFAULT_PER_HOST,
+        rate_per_host: float = 0.0,
+        burst: float = 1.0,
+        retry: RetryPolicy | None = None,
+        http2: bool | None = None,
+        adaptive: AdaptiveLimiter | None = None,
+    ):
+        self.client = httpx.AsyncClient(**_client_kwargs(headers, timeout, max_connections, http2))
+        self.per_host = max(1, per_host)
+        self.limiter = HostRateLimiter(rate_per_host, burst)
+        self.retry = retry or RetryPolicy()
+        self.adaptive = adaptive
+        self._slots: dict[str, asyncio.Semaphore] = {}
+
+    def _slot(self, url: str) -> asyncio.Semaphore:
+        host = _host(url)
+        if host not in self._slots:
+            self._slots[host] = asyncio.Semaphore(self.per_host)
+        return self._slots[host]
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        if self.adaptive is None:
+            async with self._slot(url):
+                return await self.client.request(method, url, **kwargs)
+        await self.adaptive.acquire()
+        start = time.monotonic()
+        status = None
+        cancelled = False
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            status = response.status_code
+            return response
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            if cancelled:
+                await self.adaptive.abandon()
+            else:
+                await self.adaptive.release(time.monotonic() - start, status)
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            last = attempt + 1 >= self.retry.attempts
+            await self.limiter.wait_async(url)
+            try:
+                response = await self._send(method, url, **kwargs)
+            except httpx.TransportError:
+                if last:
+                    raise
+                delay = self.retry.delay(attempt)
+            else:
+                if response.status_code not in self.retry.statuses or last:
+                    return response
+                delay = self.retry.delay(attempt, response)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def head(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("HEAD", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """
+        Streaming request under the same pacing and concurrency limits (held until the body
+        is consumed). Not retried, since a partially read body cannot be replayed.
+        """
+        await self.limiter.wait_async(url)
+        if self.adaptive is None:
+            async with self._slot(url), self.client.stream(method, url, **kwargs) as response:
+                yield response
+            return
+        await self.adaptive.acquire()
+        start = time.monotonic()
+        status = None
+        cancelled = False
+        try:
+            async with self.client.stream(method, url, **kwargs) as response:
+                status = response.status_code
+                yield response
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            if cancelled:
+                await self.adaptive.abandon()
+            else:
+                await self.adaptive.release(time.monotonic() - start, status)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def __aenter__(self) -> AsyncHttpClient:
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
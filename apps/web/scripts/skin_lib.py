@@ -5,21 +5,36 @@ A shared library for skin analysis scripts, containing Pydantic models,
 helper functions, and agent configuration.
 """
 
+import atexit
+import hashlib
 import json
 import os
 import sys
 import tempfile
+import time
+import uuid
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from typing import Any, Literal
 
-from dotenv import load_dotenv
+import pydantic_core
+from genai_prices import calc_price
 from loguru import logger
 from pydantic import BaseModel, Field
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart
 from pydantic_ai.models.google import GoogleModel, GoogleModelSettings
+from pydantic_ai.models.instrumented import InstrumentationSettings
 from pydantic_ai.models.openai import OpenAIChatModel, OpenAIModelSettings
 from pydantic_ai.providers.google import GoogleProvider
 from pydantic_ai.providers.openai import OpenAIProvider
 from pydantic_ai.settings import ModelSettings
-from supabase import Client, create_client
+from pydantic_ai.usage import RunUsage
+from storage_lib import get_supabase_client  # noqa: F401  (re-exported for the scripts)
+from supabase import Client
 
 # --- Simplified Pydantic Output Models ---
 
@@ -314,6 +329,7 @@ def setup_logger():
         sys.stderr,
         format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
         colorize=True,
+        filter=lambda record: "trace" not in record["extra"],  # span records only go to the file sink
     )
     logger.add(
         "logs/ai_scripts.log",
@@ -325,18 +341,134 @@ def setup_logger():
     return logger
 
 
-def get_supabase_client() -> Client:
-    """Initialize and return a Supabase client."""
-    load_dotenv(".env.local")
+# --- Tracing ---
+# Spans are written as structured records (extra.trace) to the serialized log sink, which
+# trace_report.py aggregates into per-stage p50/p95. With OTEL_EXPORTER_OTLP_ENDPOINT set
+# (and opentelemetry-sdk + opentelemetry-exporter-otlp-proto-http installed) they are also
+# exported over OTLP, together with pydantic-ai's own model-request spans.
 
-    supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-    # Prioritize Service Role Key for backend scripts to bypass RLS, fallback to Anon Key
-    supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+_trace_context: ContextVar[dict[str, Any] | None] = ContextVar("trace_context", default=None)
+_current_span: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+_otel_tracer = None
 
-    if not supabase_url or not supabase_key:
-        raise ValueError("Missing Supabase credentials in .env.local")
+# pydantic-ai provider prefixes -> genai-prices provider ids
+PRICE_PROVIDERS = {"google-gla": "google", "google-vertex": "google", "openai": "openai"}
 
-    return create_client(supabase_url, supabase_key)
+
+@dataclass
+class Span:
+    name: str
+    attrs: dict[str, Any] = field(default_factory=dict)
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    parent_id: str | None = None
+    duration_s: float = 0.0
+
+    def set(self, **attrs: Any):
+        self.attrs.update(attrs)
+
+
+def setup_tracing(script: str, **context: Any) -> str:
+    """
+    Starts a trace for this run: every span recorded afterwards carries its trace_id plus the
+    given context (user_id, analysis_id, ...). Returns the trace_id.
+    """
+    trace_id = uuid.uuid4().hex
+    _trace_context.set({"trace_id": trace_id, "script": script, **{k: v for k, v in context.items() if v is not None}})
+    if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT") and _otel_tracer is None:
+        _enable_otel_export(script)
+    return trace_id
+
+
+def _enable_otel_export(service: str):
+    global _otel_tracer
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning(
+            "OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk / opentelemetry-exporter-otlp-proto-http "
+            "are not installed; spans are only written to the log."
+        )
+        return
+
+    provider = TracerProvider(resource=Resource.create({"service.name": f"lila-{service}"}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    atexit.register(provider.shutdown)
+    _otel_tracer = provider.get_tracer("lila.scripts")
+    # Prompts carry user photos and health data, so model spans only get timings and token counts
+    Agent.instrument_all(
+        InstrumentationSettings(tracer_provider=provider, include_content=False, include_binary_content=False)
+    )
+    logger.info(f"Exporting trace spans to {os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')}.")
+
+
+@contextmanager
+def trace_span(name: str, **attrs: Any) -> Iterator[Span]:
+    """
+    Times the enclosed block as one pipeline stage ('s3.download', 'llm.generator', ...).
+    Attributes can be added while it runs via `span.set(...)`; `span.duration_s` is set on exit.
+    """
+    parent = _current_span.get()
+    span = Span(name, dict(attrs), parent_id=parent.span_id if parent else None)
+    token = _current_span.set(span)
+    status = "ok"
+    otel_span = _otel_tracer.start_span(name) if _otel_tracer is not None else None
+    start = time.perf_counter()
+    try:
+        yield span
+    except BaseException as e:
+        status = "error"
+        span.set(error=type(e).__name__)
+        raise
+    finally:
+        span.duration_s = time.perf_counter() - start
+        _current_span.reset(token)
+        record = {
+            **(_trace_context.get() or {}),
+            "span": name,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "duration_s": round(span.duration_s, 4),
+            "status": status,
+            **span.attrs,
+        }
+        logger.bind(trace=record).debug(f"span {name} {status} in {span.duration_s:.3f}s")
+        if otel_span is not None:
+            otel_span.set_attributes(
+                {k: v for k, v in record.items() if isinstance(v, str | bool | int | float) and k != "span"}
+            )
+            otel_span.end()
+
+
+def estimate_cost(model_str: str, usage: RunUsage) -> float | None:
+    """Approximate USD cost of an agent call from genai-prices, None for models it doesn't know."""
+    provider, _, model_name = model_str.partition(":")
+    if not model_name:
+        provider, model_name = "", provider
+    try:
+        return float(
+            calc_price(usage, model_name, provider_id=PRICE_PROVIDERS.get(provider, provider) or None).total_price
+        )
+    except LookupError:
+        return None
+
+
+def record_llm_usage(span: Span, model_str: str, usage: RunUsage | None) -> float | None:
+    """Adds the model, token counts and estimated cost of one agent call to its span; returns the cost."""
+    span.set(model=model_str)
+    if usage is None:
+        return None
+    cost = estimate_cost(model_str, usage)
+    span.set(
+        input_tokens=usage.input_tokens,
+        cache_read_tokens=usage.cache_read_tokens,
+        output_tokens=usage.output_tokens,
+        requests=usage.requests,
+        cost_usd=round(cost, 6) if cost is not None else None,
+    )
+    return cost
 
 
 def get_s3_client():
@@ -374,7 +506,9 @@ def list_latest_s3_batch(bucket_name: str, user_id: str):
     logger.info(f"Listing S3 objects in bucket '{bucket_name}' with prefix '{prefix}'...")
 
     try:
-        response = s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
+        with trace_span("s3.list", bucket=bucket_name) as span:
+            response = s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
+            span.set(objects=len(response.get("Contents") or []))
         if "Contents" not in response:
             logger.error(f"No files found in S3 bucket '{bucket_name}' for user '{user_id}'")
             return None
@@ -429,12 +563,14 @@ def download_files_from_s3(bucket_name: str, keys: list[str], dest_dir: str, s3_
 
     downloaded_paths = []
     try:
-        for key in keys:
-            filename = key.split("/")[-1]
-            local_path = os.path.join(dest_dir, filename)
-            logger.debug(f"Downloading {key} to {local_path}...")
-            s3_client.download_file(bucket_name, key, local_path)
-            downloaded_paths.append(local_path)
+        with trace_span("s3.download", bucket=bucket_name, files=len(keys)) as span:
+            for key in keys:
+                filename = key.split("/")[-1]
+                local_path = os.path.join(dest_dir, filename)
+                logger.debug(f"Downloading {key} to {local_path}...")
+                s3_client.download_file(bucket_name, key, local_path)
+                downloaded_paths.append(local_path)
+            span.set(bytes=sum(os.path.getsize(path) for path in downloaded_paths))
         return downloaded_paths
     except Exception as e:
         logger.error(f"S3 Download Error: {e}")
@@ -464,6 +600,31 @@ def download_from_s3(bucket_name: str, user_id: str):
     return downloaded_paths, temp_dir, target_keys
 
 
+# --- Ingredients ---
+
+INGREDIENTS_PAGE_SIZE = 1000
+
+
+def fetch_ingredient_rows(supabase: Client, columns: str) -> list[dict[str, Any]]:
+    """Every ingredients_1 row (selected columns), paged by ingredient_slug."""
+    rows: list[dict[str, Any]] = []
+    start = 0
+    with trace_span("db.select", table="ingredients_1") as span:
+        while True:
+            response = (
+                supabase.table("ingredients_1")
+                .select(columns)
+                .order("ingredient_slug")
+                .range(start, start + INGREDIENTS_PAGE_SIZE - 1)
+                .execute()
+            )
+            rows.extend(response.data)
+            if len(response.data) < INGREDIENTS_PAGE_SIZE:
+                span.set(rows=len(rows))
+                return rows
+            start += INGREDIENTS_PAGE_SIZE
+
+
 def distill_analysis_for_prompt(analysis_data: dict) -> str:
     """
     Converts the detailed analysis JSON into a concise, clinically relevant summary for the LLM.
@@ -644,6 +805,100 @@ def format_products_as_markdown(products: list[dict[str, Any]]) -> str:
     return "\n\n---\n\n".join(formatted_output)
 
 
+# --- Token-Budgeted Product Context ---
+
+CHARS_PER_TOKEN = 4
+# Fields in order of usefulness to the generator; whatever doesn't fit the per-product budget is dropped
+COMPACT_FIELDS = [
+    "matched_key_ingredients",
+    "active_ingredients",
+    "concerns",
+    "benefits",
+    "price",
+    "attributes",
+    "description",
+    "overview",
+    "meta_data",
+]
+DEDUPE_MIN_CHARS = 40
+MIN_PRODUCT_TOKENS = 24
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting prompts."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _compact_value(value: Any) -> str:
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value if v not in (None, ""))
+    if isinstance(value, dict):
+        return "; ".join(f"{k.replace('_', ' ')}: {_compact_value(v)}" for k, v in value.items() if v)
+    return " ".join(str(value).split())
+
+
+def format_products_compact(products: list[dict[str, Any]], budget_tokens: int) -> tuple[str, int]:
+    """
+    Token-budgeted alternative to format_products_as_markdown. Returns (markdown, estimated tokens).
+
+    - Each product gets an equal share of the budget; the header (brand, name, slug, category,
+      rating) is always kept and the COMPACT_FIELDS are added in order until the share runs out,
+      truncating the field that crosses it.
+    - Long values repeated across products (attribute lists, boilerplate overviews) are written
+      once in a shared legend and referenced as [S1], [S2], ...
+    - URLs are left out; the generator refers to products by product_slug.
+    """
+    if not products:
+        return "No relevant products found.", 0
+
+    rendered = [{key: _compact_value(p[key]) for key in COMPACT_FIELDS if p.get(key)} for p in products]
+    counts: dict[str, int] = {}
+    for fields in rendered:
+        for value in fields.values():
+            if len(value) >= DEDUPE_MIN_CHARS:
+                counts[value] = counts.get(value, 0) + 1
+    shared = {value: f"S{i}" for i, value in enumerate((v for v, n in counts.items() if n > 1), 1)}
+    legend_tokens = sum(estimate_tokens(f"*   [{ref}] {value}") for value, ref in shared.items())
+    per_product = max(MIN_PRODUCT_TOKENS, (budget_tokens - legend_tokens) // len(products))
+
+    cards: list[str] = []
+    used_refs: set[str] = set()
+    for idx, (product, fields) in enumerate(zip(products, rendered, strict=True), 1):
+        brand = product.get("brand", "Unknown Brand")
+        name = product.get("name", product.get("title", "Unknown Product"))
+        header = f"### {idx}. [{brand}] {name} (`{product.get('product_slug', 'N/A')}`)"
+        facts = [product.get("category")]
+        if product.get("rating"):
+            facts.append(
+                f"rated {product['rating']}" + (f" ({product['review_count']})" if product.get("review_count") else "")
+            )
+        lines = [header] + ([f"*   {' | '.join(str(f) for f in facts if f)}"] if any(facts) else [])
+
+        remaining = per_product * CHARS_PER_TOKEN - sum(len(line) + 1 for line in lines)
+        for key, value in fields.items():
+            label = key.replace("_", " ").title()
+            ref = shared.get(value)
+            line = f"*   **{label}:** " + (f"[{ref}]" if ref else value)
+            if len(line) + 1 > remaining:
+                # Truncate the crossing field if a useful chunk still fits, then stop
+                if not ref and remaining - len(label) > DEDUPE_MIN_CHARS:
+                    lines.append(line[: remaining - 2] + "…")
+                break
+            if ref:
+                used_refs.add(ref)
+            lines.append(line)
+            remaining -= len(line) + 1
+        cards.append("\n".join(lines))
+
+    parts = []
+    legend = [f"*   [{ref}] {value}" for value, ref in shared.items() if ref in used_refs]
+    if legend:
+        parts.append("**Shared values (referenced below):**\n" + "\n".join(legend))
+    parts.append("\n\n".join(cards))
+    text = "\n\n---\n\n".join(parts)
+    return text, estimate_tokens(text)
+
+
 def get_media_type(file_path: str) -> str:
     """Determine the media type of a file based on its extension."""
     ext = os.path.splitext(file_path)[1].lower()
@@ -692,8 +947,22 @@ def load_product_catalog(file_path: str) -> list[dict[str, Any]]:
     return products
 
 
-def create_agent(model_str: str, api_key: str | None, reasoning_effort: str | None):
-    """Configure and initialize the AI agent."""
+def prompt_cache_key(*static_parts: str) -> str:
+    """Stable key for a static prompt prefix, so calls sharing it are routed to the same provider cache."""
+    digest = hashlib.sha256("\x00".join(static_parts).encode("utf-8")).hexdigest()
+    return f"lila-{digest[:16]}"
+
+
+def create_agent(model_str: str, api_key: str | None, reasoning_effort: str | None, cache_key: str | None = None):
+    """
+    Configure and initialize the AI agent.
+
+    Prompt caching is prefix-based on both providers, so callers keep the static parts (system
+    prompt, catalog context) at the front of every request and append per-call content last.
+    OpenAI additionally routes on `cache_key` (prompt_cache_key). Gemini 2.5 caches implicit
+    prefixes on its own; explicit cached content can't be combined with the system instruction
+    and output tools every pydantic-ai structured call sends.
+    """
     provider_name, model_name = model_str.split(":", 1)
 
     model = None
@@ -714,6 +983,8 @@ def create_agent(model_str: str, api_key: str | None, reasoning_effort: str | No
         model = OpenAIChatModel(model_name, provider=provider)
         if reasoning_effort:
             settings_kwargs["openai_reasoning_effort"] = reasoning_effort
+        if cache_key:
+            settings_kwargs["extra_body"] = {"prompt_cache_key": cache_key}
         model_settings = OpenAIModelSettings(**settings_kwargs)
     else:
         model = model_str
@@ -723,3 +994,195 @@ def create_agent(model_str: str, api_key: str | None, reasoning_effort: str | No
         raise ValueError(f"Unsupported provider: {provider_name}")
 
     return model, model_settings
+
+
+# --- Prompt Cache Stats ---
+
+
+def log_cache_usage(label: str, usage: RunUsage | None, totals: dict[str, int] | None = None):
+    """Logs prompt-cache hits for one agent call and adds them to `totals` if given."""
+    if usage is None:
+        return
+    ratio = usage.cache_read_tokens / usage.input_tokens if usage.input_tokens else 0.0
+    logger.info(
+        f"[{label}] input {usage.input_tokens} tokens, cache read {usage.cache_read_tokens} ({ratio:.0%}), "
+        f"cache write {usage.cache_write_tokens}, output {usage.output_tokens}."
+    )
+    if totals is not None:
+        for key in ("input_tokens", "cache_read_tokens", "output_tokens"):
+            totals[key] = totals.get(key, 0) + getattr(usage, key)
+
+
+# --- Streaming Structured Output ---
+
+
+@dataclass
+class StreamStats:
+    ttft_s: float | None = None  # time to the first streamed chunk of the response
+    total_s: float = 0.0
+    usage: RunUsage | None = None
+
+
+def partial_output(response: ModelResponse) -> dict[str, Any] | None:
+    """Best-effort parse of the structured output streamed so far (tool-call args or JSON text)."""
+    for part in reversed(response.parts):
+        if isinstance(part, ToolCallPart):
+            raw = part.args
+        elif isinstance(part, TextPart):
+            raw = part.content
+        else:
+            continue
+        if isinstance(raw, dict):
+            return raw
+        try:
+            parsed = pydantic_core.from_json(raw or "", allow_partial=True)
+        except ValueError:
+            return None
+        return parsed if isinstance(parsed, dict) else None
+    return None
+
+
+async def run_agent_streaming(
+    agent: Agent,
+    prompt: Any,
+    model_settings: ModelSettings | None = None,
+    on_progress: Callable[[dict[str, Any]], None] | None = None,
+    debounce_by: float = 0.5,
+) -> tuple[Any, StreamStats]:
+    """
+    Runs an agent with streamed structured output. `on_progress` receives the partially parsed
+    output (a plain dict) every `debounce_by` seconds; the validated output is returned at the end.
+    """
+    timing = StreamStats()
+    start = time.perf_counter()
+    async with agent.run_stream(prompt, model_settings=model_settings) as result:
+        async for item in result.stream_responses(debounce_by=debounce_by):
+            # (response, is_last) tuples on StreamedRunResult; bare responses on older releases
+            response = item[0] if isinstance(item, tuple) else item
+            if timing.ttft_s is None:
+                timing.ttft_s = time.perf_counter() - start
+            if on_progress is not None:
+                partial = partial_output(response)
+                if partial:
+                    on_progress(partial)
+        output = await result.get_output()
+        timing.usage = result.usage()
+    timing.total_s = time.perf_counter() - start
+    return output, timing
+
+
+class AnalysisProgress:
+    """
+    Best-effort writer for skin_analyses.progress, the channel the dashboard polls while a
+    run is in flight. Only changed snapshots are written; after the first failure (e.g. the
+    column isn't migrated yet) writes are skipped with a single warning.
+    """
+
+    def __init__(self, supabase: Client, analysis_id: str, stage: str):
+        self.supabase = supabase
+        self.analysis_id = analysis_id
+        self.stage = stage
+        self.last: dict[str, Any] | None = None
+        self.enabled = True
+
+    def update(self, **fields: Any):
+        snapshot = {"stage": self.stage, **fields}
+        if not self.enabled or snapshot == self.last:
+            return
+        self.last = snapshot
+        try:
+            with trace_span("db.write", table="skin_analyses", column="progress"):
+                self.supabase.table("skin_analyses").update(
+                    {"progress": {**snapshot, "updated_at": datetime.now(timezone.utc).isoformat()}}
+                ).eq("id", self.analysis_id).execute()
+        except Exception as e:
+            logger.warning(f"Could not write progress for analysis {self.analysis_id}, disabling updates: {e}")
+            self.enabled = False
+
+
+# --- Usage Ledger ---
+
+
+class UsageLedger:
+    """
+    Per-run accounting of every model call. Each call becomes a usage_ledger row (user,
+    analysis, run, stage, model, tokens, estimated cost); writes are best-effort like
+    AnalysisProgress. The running totals back the run's token and cost budgets.
+    """
+
+    def __init__(
+        self,
+        supabase: Client | None,
+        run_id: str,
+        script: str,
+        user_id: str | None = None,
+        analysis_id: str | None = None,
+        max_tokens: int | None = None,
+        max_cost_usd: float | None = None,
+    ):
+        self.supabase = supabase
+        self.run_id = run_id
+        self.script = script
+        self.user_id = user_id
+        self.analysis_id = analysis_id
+        self.max_tokens = max_tokens
+        self.max_cost_usd = max_cost_usd
+        self.calls = 0
+        self.tokens = 0
+        self.cost_usd = 0.0
+        self.unpriced_calls = 0
+        self.enabled = supabase is not None
+
+    def record(self, stage: str, model_str: str, usage: RunUsage | None, span: Span | None = None):
+        """Accounts one call (and adds its usage to `span` if given)."""
+        cost = record_llm_usage(span, model_str, usage) if span is not None else None
+        if usage is None:
+            return
+        if span is None:
+            cost = estimate_cost(model_str, usage)
+        self.calls += 1
+        self.tokens += usage.input_tokens + usage.output_tokens
+        if cost is None:
+            self.unpriced_calls += 1
+        else:
+            self.cost_usd += cost
+        if not self.enabled:
+            return
+        row = {
+            "run_id": self.run_id,
+            "script": self.script,
+            "user_id": self.user_id,
+            "analysis_id": self.analysis_id,
+            "stage": stage,
+            "model": model_str,
+            "input_tokens": usage.input_tokens,
+            "cache_read_tokens": usage.cache_read_tokens,
+            "output_tokens": usage.output_tokens,
+            "requests": usage.requests,
+            "cost_usd": round(cost, 6) if cost is not None else None,
+        }
+        try:
+            with trace_span("db.write", table="usage_ledger"):
+                self.supabase.table("usage_ledger").insert(row).execute()
+        except Exception as e:
+            logger.warning(f"Could not write to usage_ledger, disabling writes: {e}")
+            self.enabled = False
+
+    def over_budget(self, next_tokens: int = 0, next_cost_usd: float = 0.0) -> str | None:
+        """
+        Why the run has to stop: its budget is used up, or would be by a next step of the given
+        size (e.g. the previous attempt's spend). None while it fits.
+        """
+        if self.max_tokens is not None and self.tokens + next_tokens > self.max_tokens:
+            return f"token budget of {self.max_tokens} reached ({self.tokens} used" + (
+                f", next attempt ~{next_tokens})" if next_tokens else ")"
+            )
+        if self.max_cost_usd is not None and self.cost_usd + next_cost_usd > self.max_cost_usd:
+            return f"cost budget of ${self.max_cost_usd:.2f} reached (${self.cost_usd:.4f} used" + (
+                f", next attempt ~${next_cost_usd:.4f})" if next_cost_usd else ")"
+            )
+        return None
+
+    def summary(self) -> str:
+        unpriced = f" ({self.unpriced_calls} call(s) without a known price)" if self.unpriced_calls else ""
+        return f"{self.calls} model call(s), {self.tokens} tokens, ~${self.cost_usd:.4f}{unpriced}"
@@ -0,0 +1,67 @@
+"""
+storage_lib.py
+
+Supabase client setup and product-image bucket helpers, shared by the LLM scripts (via
+skin_lib) and the scrapers/migrations that upload images. Only depends on supabase and
+python-dotenv, and imports supabase when a client is first created, so importing this
+module costs nothing for offline runs.
+"""
+
+from __future__ import annotations
+
+import mimetypes
+import os
+from typing import TYPE_CHECKING
+
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+PRODUCT_IMAGES_BUCKET = "product-images"
+STORAGE_LIST_PAGE_SIZE = 1000
+
+
+def get_supabase_client() -> Client:
+    """Initialize and return a Supabase client."""
+    from supabase import create_client
+
+    load_dotenv(".env.local")
+
+    supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+    # Prioritize Service Role Key for backend scripts to bypass RLS, fallback to Anon Key
+    supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+
+    if not supabase_url or not supabase_key:
+        raise ValueError("Missing Supabase credentials in .env.local")
+
+    return create_client(supabase_url, supabase_key)
+
+
+def list_bucket_objects(supabase: Client, bucket: str = PRODUCT_IMAGES_BUCKET) -> dict[str, int]:
+    """Returns {object name: size in bytes} for every file at the top level of a storage bucket."""
+    objects: dict[str, int] = {}
+    offset = 0
+    while True:
+        page = supabase.storage.from_(bucket).list(
+            "",
+            {"limit": STORAGE_LIST_PAGE_SIZE, "offset": offset, "sortBy": {"column": "name", "order": "asc"}},
+        )
+        for obj in page:
+            metadata = obj.get("metadata")
+            if metadata:  # folders come back without metadata
+                objects[obj["name"]] = int(metadata.get("size") or 0)
+        if len(page) < STORAGE_LIST_PAGE_SIZE:
+            return objects
+        offset += STORAGE_LIST_PAGE_SIZE
+
+
+def upload_product_image(supabase: Client, file_path: str, bucket: str = PRODUCT_IMAGES_BUCKET) -> str:
+    """Upserts a local file into the bucket under its base name and returns its public URL."""
+    name = os.path.basename(file_path)
+    content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+    with open(file_path, "rb") as f:
+        supabase.storage.from_(bucket).upload(
+            path=name, file=f, file_options={"content-type": content_type, "upsert": "true"}
+        )
+    return supabase.storage.from_(bucket).get_public_url(name)
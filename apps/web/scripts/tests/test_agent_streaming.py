@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+from pydantic import BaseModel
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelMessage, ModelResponse, ToolCallPart
+from pydantic_ai.models.function import AgentInfo, DeltaToolCall, FunctionModel
+from skin_lib import run_agent_streaming
+
+
+class Routine(BaseModel):
+    steps: list[str]
+
+
+ROUTINE = Routine(steps=["cleanser", "moisturizer", "sunscreen"])
+ROUTINE_ARGS = json.dumps(ROUTINE.model_dump())
+
+
+def loop_bound_model() -> tuple[FunctionModel, list[asyncio.AbstractEventLoop]]:
+    """
+    A model that, like the providers' cached HTTP client, binds to the event loop of its first
+    request and fails on any other loop.
+    """
+    loops: list[asyncio.AbstractEventLoop] = []
+
+    def check_loop():
+        loop = asyncio.get_running_loop()
+        if loops and loops[0] is not loop:
+            raise RuntimeError("client is bound to a different event loop")
+        loops.append(loop)
+
+    async def respond(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        check_loop()
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, ROUTINE_ARGS)])
+
+    async def stream(messages: list[ModelMessage], info: AgentInfo):
+        check_loop()
+        tool_name = info.output_tools[0].name
+        for i in range(0, len(ROUTINE_ARGS), 8):
+            yield {0: DeltaToolCall(name=tool_name if i == 0 else None, json_args=ROUTINE_ARGS[i : i + 8])}
+
+    return FunctionModel(respond, stream_function=stream), loops
+
+
+def test_two_streamed_calls_share_one_event_loop():
+    model, loops = loop_bound_model()
+    agent = Agent(model, output_type=Routine)
+    partials: list[dict] = []
+
+    async def pipeline():
+        first, first_timing = await run_agent_streaming(agent, "first", on_progress=partials.append, debounce_by=None)
+        second, second_timing = await run_agent_streaming(agent, "second", debounce_by=None)
+        return first, first_timing, second, second_timing
+
+    first, first_timing, second, second_timing = asyncio.run(pipeline())
+
+    assert first == second == ROUTINE
+    assert len(loops) == 2
+    assert first_timing.ttft_s is not None and second_timing.ttft_s is not None
+    assert first_timing.usage is not None and second_timing.usage is not None
+    assert partials and partials[-1] == ROUTINE.model_dump()
+
+
+def test_streamed_and_plain_calls_share_one_event_loop():
+    model, loops = loop_bound_model()
+    agent = Agent(model, output_type=Routine)
+
+    async def pipeline():
+        planned = await agent.run("plan")
+        streamed, _ = await run_agent_streaming(agent, "generate")
+        reviewed = await agent.run("review")
+        return planned.output, streamed, reviewed.output
+
+    assert asyncio.run(pipeline()) == (ROUTINE, ROUTINE, ROUTINE)
+    assert len(loops) == 3
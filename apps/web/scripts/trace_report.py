@@ -0,0 +1,147 @@
+# /// script
+# requires-python = ">=3.10"
+# dependencies = []
+# ///
+"""
+trace_report.py
+
+Summarises the trace spans that skin_lib.trace_span writes to the serialized loguru sink
+(logs/ai_scripts.log and its rotated files): p50/p95/max latency per pipeline stage across
+runs, token counts and estimated cost for the LLM stages, and per-run totals per script.
+"""
+
+import argparse
+import glob
+import json
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+
+DEFAULT_LOGS = "logs/ai_scripts*.log"
+# Stages where the table name is part of the stage (db.select:skin_analyses, ...)
+TABLE_STAGES = ("db.select", "db.write")
+
+
+def load_spans(patterns: list[str], script: str | None, since: datetime | None) -> list[dict]:
+    spans: list[dict] = []
+    for path in sorted({p for pattern in patterns for p in glob.glob(pattern)}):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)["record"]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue
+                span = record.get("extra", {}).get("trace")
+                if not span:
+                    continue
+                if script and span.get("script") != script:
+                    continue
+                timestamp = datetime.fromtimestamp(record["time"]["timestamp"], tz=timezone.utc)
+                if since and timestamp < since:
+                    continue
+                spans.append(span)
+    return spans
+
+
+def stage_of(span: dict) -> str:
+    name = span["span"]
+    return f"{name}:{span['table']}" if name in TABLE_STAGES and span.get("table") else name
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Linear-interpolated percentile, q in [0, 1]."""
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q
+    low, high = math.floor(k), math.ceil(k)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def print_stage_table(spans: list[dict]):
+    by_stage: dict[str, list[dict]] = defaultdict(list)
+    for span in spans:
+        by_stage[stage_of(span)].append(span)
+
+    header = (
+        f"{'stage':<40} {'n':>5} {'runs':>5} {'err':>4} {'p50 s':>8} {'p95 s':>8} {'max s':>8} "
+        f"{'in tok p50':>10} {'out tok p50':>11} {'cost $':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for stage, group in sorted(by_stage.items(), key=lambda item: -sum(s["duration_s"] for s in item[1])):
+        durations = [s["duration_s"] for s in group]
+        runs = len({s.get("trace_id") for s in group})
+        errors = sum(1 for s in group if s.get("status") == "error")
+        input_tokens = [s["input_tokens"] for s in group if s.get("input_tokens") is not None]
+        output_tokens = [s["output_tokens"] for s in group if s.get("output_tokens") is not None]
+        costs = [s["cost_usd"] for s in group if s.get("cost_usd") is not None]
+        print(
+            f"{stage:<40} {len(group):>5} {runs:>5} {errors:>4} "
+            f"{percentile(durations, 0.5):>8.2f} {percentile(durations, 0.95):>8.2f} {max(durations):>8.2f} "
+            f"{percentile(input_tokens, 0.5) if input_tokens else 0:>10.0f} "
+            f"{percentile(output_tokens, 0.5) if output_tokens else 0:>11.0f} "
+            f"{sum(costs) if costs else 0:>9.4f}"
+        )
+
+
+def print_run_table(spans: list[dict]):
+    """Per script: p50/p95 of the summed LLM time, tokens and cost of each run (trace_id)."""
+    runs: dict[tuple[str, str], dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for span in spans:
+        if not span.get("trace_id") or not span["span"].startswith("llm."):
+            continue
+        run = runs[(span.get("script", "?"), span["trace_id"])]
+        run["llm_s"] += span["duration_s"]
+        run["tokens"] += (span.get("input_tokens") or 0) + (span.get("output_tokens") or 0)
+        run["cost"] += span.get("cost_usd") or 0.0
+        run["calls"] += 1
+
+    by_script: dict[str, list[dict[str, float]]] = defaultdict(list)
+    for (script, _), totals in runs.items():
+        by_script[script].append(totals)
+
+    header = (
+        f"{'script':<28} {'runs':>5} {'calls p50':>9} {'llm s p50':>10} {'llm s p95':>10} "
+        f"{'tokens p50':>10} {'tokens p95':>10} {'cost p50':>9} {'cost p95':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for script, totals in sorted(by_script.items()):
+
+        def pct(key: str, q: float, totals: list[dict[str, float]] = totals) -> float:
+            return percentile([t[key] for t in totals], q)
+
+        print(
+            f"{script:<28} {len(totals):>5} {pct('calls', 0.5):>9.0f} {pct('llm_s', 0.5):>10.1f} "
+            f"{pct('llm_s', 0.95):>10.1f} {pct('tokens', 0.5):>10.0f} {pct('tokens', 0.95):>10.0f} "
+            f"{pct('cost', 0.5):>9.4f} {pct('cost', 0.95):>9.4f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage latency and token report from the trace spans in the logs.")
+    parser.add_argument(
+        "--logs", type=str, nargs="+", default=[DEFAULT_LOGS], help="Serialized log files (globs allowed)."
+    )
+    parser.add_argument("--script", type=str, help="Only spans from this script (e.g. run_analysis).")
+    parser.add_argument("--since", type=str, help="Only spans at or after this ISO date/time (UTC if no offset).")
+    args = parser.parse_args()
+
+    since = None
+    if args.since:
+        since = datetime.fromisoformat(args.since)
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+
+    spans = load_spans(args.logs, args.script, since)
+    if not spans:
+        print("No trace spans found.")
+        return
+
+    print(f"{len(spans)} spans from {len({s.get('trace_id') for s in spans})} runs.\n")
+    print_stage_table(spans)
+    print()
+    print_run_table(spans)
+
+
+if __name__ == "__main__":
+    main()
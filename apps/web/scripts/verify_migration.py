@@ -3,15 +3,31 @@
 # dependencies = [
 #     "supabase",
 #     "python-dotenv",
-#     "requests",
+#     "httpx[http2]",
+#     "tqdm",
 # ]
 # ///
-
+"""
+verify_migration.py
+
+Verifies every products_1.image_url after the image migration: pages through the table,
+sends concurrent HEAD requests over one pooled client and writes a JSONL report with one
+row per product (ok, not_storage, broken, redirected, wrong_content_type or error, plus
+HTTP status, final URL, content type and size). `--only-failed` re-checks just the rows
+that were not ok in the previous report.
+"""
+
+import argparse
+import asyncio
+import json
 import os
+from collections import Counter
 
-import requests
+import httpx
 from dotenv import load_dotenv
+from scrape_lib import AsyncHttpClient, RetryPolicy
 from supabase import Client, create_client
+from tqdm.asyncio import tqdm
 
 load_dotenv(".env.local")
 
@@ -24,50 +40,128 @@ if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
-
-def verify_migration():
-    print("Verifying migration...")
-
-    # 1. Fetch 10 random products with image_url
-    response = (
-        supabase.table("products_1")
-        .select("product_slug, name, image_url")
-        .not_.is_("image_url", "null")
-        .limit(10)
-        .execute()
+PAGE_SIZE = 1000
+IN_CHUNK = 200
+DEFAULT_CONCURRENCY = 32
+REPORT_FILE = "verify_migration_report.jsonl"
+
+
+def fetch_products(slugs: list[str] | None = None) -> list[dict]:
+    """Every product with an image_url, paged by product_slug (or just the given slugs)."""
+    columns = "product_slug, name, image_url"
+    if slugs is not None:
+        rows: list[dict] = []
+        for i in range(0, len(slugs), IN_CHUNK):
+            response = (
+                supabase.table("products_1").select(columns).in_("product_slug", slugs[i : i + IN_CHUNK]).execute()
+            )
+            rows.extend(response.data)
+        return rows
+
+    rows = []
+    start = 0
+    while True:
+        response = (
+            supabase.table("products_1")
+            .select(columns)
+            .not_.is_("image_url", "null")
+            .order("product_slug")
+            .range(start, start + PAGE_SIZE - 1)
+            .execute()
+        )
+        rows.extend(response.data)
+        if len(response.data) < PAGE_SIZE:
+            return rows
+        start += PAGE_SIZE
+
+
+def load_report(report_path: str) -> dict[str, dict]:
+    with open(report_path, encoding="utf-8") as f:
+        return {row["product_slug"]: row for row in map(json.loads, f)}
+
+
+async def check_product(client: AsyncHttpClient, product: dict) -> dict:
+    url = product.get("image_url")
+    result = {"product_slug": product["product_slug"], "url": url}
+
+    # Check if URL is from Supabase Storage
+    if not url or "supabase.co/storage" not in url:
+        return {**result, "status": "not_storage"}
+
+    try:
+        r = await client.head(url)
+    except httpx.HTTPError as e:
+        return {**result, "status": "error", "error": str(e) or type(e).__name__}
+
+    content_type = r.headers.get("content-type", "")
+    size = r.headers.get("content-length")
+    result.update(
+        http_status=r.status_code,
+        final_url=str(r.url),
+        content_type=content_type or None,
+        size=int(size) if size and size.isdigit() else None,
     )
+    if r.status_code != 200:
+        status = "broken"
+    elif r.history:
+        status = "redirected"
+    elif not content_type.startswith("image/"):
+        status = "wrong_content_type"
+    else:
+        status = "ok"
+    return {**result, "status": status}
+
+
+async def verify_migration(report_path: str, only_failed: bool, concurrency: int):
+    print("Verifying migration...")
 
-    products = response.data
+    previous: dict[str, dict] = {}
+    slugs = None
+    if only_failed:
+        try:
+            previous = load_report(report_path)
+        except FileNotFoundError:
+            print(f"Error: --only-failed needs an existing report, but {report_path} was not found.")
+            exit(1)
+        slugs = [slug for slug, row in previous.items() if row["status"] != "ok"]
+        if not slugs:
+            print(f"Nothing to re-check: no failing products in {report_path}")
+            return
+        print(f"Re-checking {len(slugs)} previously failing products from {report_path}...")
+    products = await asyncio.to_thread(fetch_products, slugs)
     if not products:
         print("No products found with image_url!")
         return
 
     print(f"Checking {len(products)} products...")
 
-    success_count = 0
+    async with AsyncHttpClient(
+        timeout=20.0, max_connections=concurrency, per_host=concurrency, retry=RetryPolicy(attempts=3)
+    ) as client:
+        results = await tqdm.gather(*(check_product(client, p) for p in products), desc="HEAD")
 
-    for p in products:
-        url = p["image_url"]
-        slug = p["product_slug"]
+    # A --only-failed run rewrites its rows in place and keeps the earlier ok rows
+    merged = {**previous, **{r["product_slug"]: r for r in results}}
+    with open(report_path, "w", encoding="utf-8") as f:
+        for row in sorted(merged.values(), key=lambda r: r["product_slug"]):
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
 
-        # Check if URL is from Supabase Storage
-        if "supabase.co/storage" not in url:
-            print(f"[FAIL] {slug}: URL is not Supabase Storage -> {url}")
-            continue
-
-        # Check functionality
-        try:
-            r = requests.head(url)
-            if r.status_code == 200:
-                print(f"[OK] {slug}")
-                success_count += 1
-            else:
-                print(f"[FAIL] {slug}: HTTP {r.status_code}")
-        except Exception as e:
-            print(f"[FAIL] {slug}: Error {e}")
-
-    print(f"\nVerification Results: {success_count}/{len(products)} readable.")
+    counts = Counter(r["status"] for r in results)
+    for row in results:
+        if row["status"] != "ok":
+            print(f"[FAIL] {row['product_slug']}: {row['status']} {row.get('http_status') or row.get('error') or ''}")
+    print(f"\nVerification Results: {counts['ok']}/{len(results)} readable.")
+    print(", ".join(f"{status}={n}" for status, n in sorted(counts.items())))
+    print(f"Report written to {report_path}")
 
 
 if __name__ == "__main__":
-    verify_migration()
+    parser = argparse.ArgumentParser(description="Verify migrated product image URLs.")
+    parser.add_argument("--report", type=str, default=REPORT_FILE, help="JSONL report file (read by --only-failed).")
+    parser.add_argument(
+        "--only-failed", action="store_true", help="Only re-check rows that were not ok in the existing report."
+    )
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Concurrent HEAD requests.")
+    args = parser.parse_args()
+
+    asyncio.run(verify_migration(args.report, args.only_failed, max(1, args.concurrency)))